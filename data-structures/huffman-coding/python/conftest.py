@@ -1,3 +1,10 @@
 import os
 import sys
 sys.path.insert(0, os.path.dirname(__file__))
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--update-size-baseline', action='store_true', default=False,
+        help='Record encoded sizes from test_huff_bench.py as the new baseline',
+    )
@@ -1,44 +1,185 @@
+import argparse
+import codecs
 import heapq
+import mmap
+import os
 import struct
+import sys
+import time
+import zlib
 from collections import Counter
-from dataclasses import dataclass
-from functools import total_ordering
-from typing import Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import cached_property, lru_cache
+from operator import itemgetter
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
 from bitarray import bitarray
+from bitarray.util import ba2int
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Characters of a str, or byte values of a bytes-like object
+Symbol = Union[str, int]
+
+
+class HuffTree:
+    """A Huffman tree stored as parallel arrays indexed by node ID
+
+    Leaves take IDs 0..n-1 in symbol order, and each merge appends a parent,
+    so a parent's ID is always greater than its children's, and the root is
+    the last node. The heap holds plain (weight, id) tuples, which compare
+    without calling back into Python.
+
+    node() returns HuffNode views, for callers which want to walk it.
+    """
+
+    __slots__ = ('weights', 'lefts', 'rights', 'symbols', 'total')
+
+    def __init__(self, sym_counts: Dict[Symbol, int]):
+        symbols = sorted(sym_counts)
+        weights = [sym_counts[sym] for sym in symbols]
+
+        # A lone symbol still needs a code at least one bit long, or the body
+        # would carry no information about how many times it repeats.
+        if len(symbols) == 1:
+            symbols.append(None)
+            weights.append(0)
+
+        num_leaves = len(symbols)
+        lefts = [-1] * num_leaves
+        rights = [-1] * num_leaves
+
+        heap = [(weight, i) for i, weight in enumerate(weights)]
+        heapq.heapify(heap)
+        heappop = heapq.heappop
+        heapreplace = heapq.heapreplace
+
+        parent = num_leaves
+        while len(heap) > 1:
+            left_weight, left = heappop(heap)
+            right_weight, right = heap[0]
+            weight = left_weight + right_weight
+            heapreplace(heap, (weight, parent))
+
+            weights.append(weight)
+            lefts.append(left)
+            rights.append(right)
+            parent += 1
+
+        self.weights = weights
+        self.lefts = lefts
+        self.rights = rights
+        self.symbols = symbols
+        self.total = weights[-1] if weights else 0
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    @property
+    def root(self) -> int:
+        return len(self.weights) - 1
+
+    def depths(self) -> List[int]:
+        """Return the depth of every node, by ID"""
+        lefts = self.lefts
+        rights = self.rights
+        depths = [0] * len(lefts)
+        for node in range(len(lefts) - 1, len(self.symbols) - 1, -1):
+            depth = depths[node] + 1
+            depths[lefts[node]] = depth
+            depths[rights[node]] = depth
+        return depths
+
+    def lengths(self) -> Dict[Symbol, int]:
+        """Return the code length of each symbol"""
+        depths = self.depths()
+        return {
+            sym: depths[leaf]
+            for leaf, sym in enumerate(self.symbols)
+            if sym is not None
+        }
+
+    def codes(self) -> List[bitarray]:
+        """Return the code of every node, by ID"""
+        lefts = self.lefts
+        rights = self.rights
+        codes = [bitarray()] * len(lefts)
+        for node in range(len(lefts) - 1, len(self.symbols) - 1, -1):
+            bits = codes[node]
+            codes[lefts[node]] = bits + (False,)
+            codes[rights[node]] = bits + (True,)
+        return codes
+
+    def node(self, node_id: int, bits: bitarray = None) -> 'HuffNode':
+        return HuffNode(self, node_id, bits)
 
 
-@total_ordering
-@dataclass
 class HuffNode:
-    frequency: float = None
-    left: 'HuffNode' = None
-    right: 'HuffNode' = None
-    sym: str = None
+    """A view of one node of a HuffTree"""
 
-    bits: bitarray = None
+    __slots__ = ('tree', 'id', 'bits')
 
-    @classmethod
-    def parent_for(cls, left: 'HuffNode', right: 'HuffNode'):
-        return cls(
-            left=left,
-            right=right,
-            frequency=left.frequency + right.frequency,
-        )
+    def __init__(self, tree: HuffTree, node_id: int, bits: bitarray = None):
+        self.tree = tree
+        self.id = node_id
+        self.bits = bits
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(id={self.id}, frequency={self.frequency!r}, '
+                f'sym={self.sym!r}, bits={self.bits!r})')
+
+    @property
+    def frequency(self) -> float:
+        tree = self.tree
+        return tree.weights[self.id] / tree.total if tree.total else 0.0
+
+    @property
+    def sym(self) -> Optional[Symbol]:
+        symbols = self.tree.symbols
+        return symbols[self.id] if self.id < len(symbols) else None
+
+    def _child(self, child_id: int) -> Optional['HuffNode']:
+        if child_id < 0:
+            return None
+        bit = child_id == self.tree.rights[self.id]
+        bits = self.bits + (bit,) if self.bits is not None else None
+        return HuffNode(self.tree, child_id, bits)
+
+    @property
+    def left(self) -> Optional['HuffNode']:
+        return self._child(self.tree.lefts[self.id])
+
+    @property
+    def right(self) -> Optional['HuffNode']:
+        return self._child(self.tree.rights[self.id])
 
     @property
     def is_leaf(self) -> bool:
-        return self.left is None and self.right is None
+        return self.tree.lefts[self.id] < 0
 
     def __float__(self) -> float:
         return self.frequency
 
-    def __lt__(self, other: 'HuffNode') -> bool:
+    def __lt__(self, other) -> bool:
         return self.frequency < other.frequency
 
-    def __eq__(self, other: 'HuffNode') -> bool:
+    def __le__(self, other) -> bool:
+        return self.frequency <= other.frequency
+
+    def __gt__(self, other) -> bool:
+        return self.frequency > other.frequency
+
+    def __ge__(self, other) -> bool:
+        return self.frequency >= other.frequency
+
+    def __eq__(self, other) -> bool:
         return self.frequency == other.frequency
 
+    __hash__ = None
+
     def __getitem__(self, index: int) -> Optional['HuffNode']:
         if index == 0:
             return self.left
@@ -49,107 +190,1369 @@ class HuffNode:
                 f'Slicing on a binary tree must use either a 1 or 0. Found: {index!r}')
 
 
-def encode(source: str) -> bytes:
-    sym_total = len(source)
-    sym_counts = Counter(source)
+def limited_code_lengths(sym_counts: Dict[Symbol, int], max_code_length: int) -> Dict[Symbol, int]:
+    """Return optimal code lengths for the symbols, none longer than max_code_length
+
+    Uses package-merge: each of max_code_length rounds pairs up the cheapest
+    items of the last round into packages, and merges them back in with the
+    symbols. The cheapest 2n-2 items of the final round then hold each symbol
+    once per bit of its code.
+    """
+    symbols = sorted(sym_counts)
+    if len(symbols) <= 2:
+        return {sym: 1 for sym in symbols}
+    if 1 << max_code_length < len(symbols):
+        raise ValueError(f'{len(symbols)} symbols cannot all have codes of at most '
+                         f'{max_code_length} bits')
+
+    # An item is a (weight, leaf) pair, where a leaf is a symbol index, or
+    # else a (weight, (item, item)) package.
+    leaves = sorted((sym_counts[sym], i) for i, sym in enumerate(symbols))
+    items = leaves
+    for _ in range(max_code_length - 1):
+        packages = [
+            (items[i][0] + items[i + 1][0], (items[i], items[i + 1]))
+            for i in range(0, len(items) - 1, 2)
+        ]
+        items = list(heapq.merge(leaves, packages, key=itemgetter(0)))
+
+    lengths = [0] * len(symbols)
+    to_visit = items[:2 * len(symbols) - 2]
+    while to_visit:
+        _, contents = to_visit.pop()
+        if isinstance(contents, int):
+            lengths[contents] += 1
+        else:
+            to_visit.extend(contents)
+
+    return dict(zip(symbols, lengths))
+
 
-    symbols = {
-        sym: HuffNode(frequency=sym_count / sym_total, sym=sym)
-        for sym, sym_count in sym_counts.items()
+def build_codes(sym_counts: Dict[Symbol, int]) -> Dict[Symbol, HuffNode]:
+    """Build a Huffman tree, returning its leaves (with codes assigned) by symbol"""
+    tree = HuffTree(sym_counts)
+    codes = tree.codes()
+    return {
+        sym: tree.node(leaf, codes[leaf])
+        for leaf, sym in enumerate(tree.symbols)
+        if sym is not None
     }
-    nodes = list(symbols.values())
-    heapq.heapify(nodes)
 
-    while len(nodes) > 1:
-        left = heapq.heappop(nodes)
-        right = heapq.heappop(nodes)
 
-        parent = HuffNode.parent_for(left, right)
-        heapq.heappush(nodes, parent)
+def _pack_varint(n: int) -> bytes:
+    """Pack a non-negative int 7 bits at a time, least significant group first"""
+    packed = bytearray()
+    while n > 0x7f:
+        packed.append(n & 0x7f | 0x80)
+        n >>= 7
+    packed.append(n)
+    return bytes(packed)
 
-    root = nodes[0]
 
-    height = 0
-    to_visit = [(root, bitarray(), height)]
-    while to_visit:
-        node, bits, level = to_visit.pop()
+def _unpack_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    """Unpack a varint from data[offset:], returning it and the offset past it"""
+    n = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        n |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return n, offset
+        shift += 7
+
+
+class CanonicalCode:
+    """A Huffman code in canonical form, which is fully described by its code lengths
+
+    Symbols are ordered by (code length, symbol). Walking that order, each code
+    is the previous one plus one, shifted left whenever the length grows. So
+    only the number of codes of each length and the symbols in canonical order
+    need to be stored for the decoder to rebuild every code.
+
+    Symbols are either all characters, or (if `binary`) all byte values.
+    """
+
+    def __init__(self, symbols: Sequence[Symbol], lengths: Sequence[int], binary: bool = False):
+        self.symbols = list(symbols)
+        self.lengths = list(lengths)
+        self.binary = binary
+
+        self.codes: Dict[Symbol, bitarray] = {}
+        code = 0
+        prev_length = self.lengths[0] if self.lengths else 0
+        for sym, length in zip(self.symbols, self.lengths):
+            code <<= length - prev_length
+            self.codes[sym] = bitarray(format(code, f'0{length}b'))
+            code += 1
+            prev_length = length
+
+    @classmethod
+    def from_lengths(cls, lengths: Dict[Symbol, int], binary: bool = False) -> 'CanonicalCode':
+        symbols = sorted(lengths, key=lambda sym: (lengths[sym], sym))
+        return cls(symbols, [lengths[sym] for sym in symbols], binary=binary)
+
+    @classmethod
+    def from_counts(cls, sym_counts: Dict[Symbol, int], binary: bool = False,
+                    max_code_length: Optional[int] = None) -> 'CanonicalCode':
+        """Build an optimal code for the symbol counts
 
-        if node.is_leaf:
-            node.bits = bits
+        With max_code_length, the code is optimal among those with no code
+        longer than it, bounding the depth a decoder must walk.
+        """
+        if not sym_counts:
+            return cls([], [], binary=binary)
 
-            if level > height:
-                height = level
+        lengths = HuffTree(sym_counts).lengths()
+        if max_code_length is not None and max(lengths.values()) > max_code_length:
+            lengths = limited_code_lengths(sym_counts, max_code_length)
 
+        return cls.from_lengths(lengths, binary=binary)
+
+    @classmethod
+    def from_byte_counts(cls, byte_counts: Sequence[int],
+                         max_code_length: Optional[int] = None) -> 'CanonicalCode':
+        """Build a code over the byte values with nonzero entries in a 256-long array"""
+        return cls.from_counts({
+            byte: count
+            for byte, count in enumerate(byte_counts)
+            if count
+        }, binary=True, max_code_length=max_code_length)
+
+    @property
+    def max_length(self) -> int:
+        return self.lengths[-1] if self.lengths else 0
+
+    @cached_property
+    def decode_table(self) -> 'DecodeTable':
+        if self.binary:
+            return DecodeTable({bytes([sym]): code for sym, code in self.codes.items()}, empty=b'')
+        return DecodeTable(self.codes)
+
+    def pack(self) -> bytes:
+        """Serialize as the longest code length, the number of codes of each
+        length, then the symbols in canonical order
+
+        Byte symbols are written one byte apiece. Characters are written as
+        UTF-8, prefixed by its length in bytes.
+        """
+        if self.max_length > 0xff:
+            raise ValueError(f'Codes may be at most 255 bits long. Found: {self.max_length}')
+
+        length_counts = [0] * self.max_length
+        for length in self.lengths:
+            length_counts[length - 1] += 1
+
+        if self.binary:
+            sym_table = [bytes(self.symbols)]
         else:
-            to_visit.append((node.left, bits + (False,), level + 1))
-            to_visit.append((node.right, bits + (True,), level + 1))
+            sym_bytes = ''.join(self.symbols).encode('utf-8', 'surrogatepass')
+            sym_table = [_pack_varint(len(sym_bytes)), sym_bytes]
+
+        return b''.join([
+            bytes([self.max_length]),
+            *map(_pack_varint, length_counts),
+            *sym_table,
+        ])
+
+    @classmethod
+    def unpack(cls, data: bytes, offset: int = 0, binary: bool = False) -> Tuple['CanonicalCode', int]:
+        """Deserialize from data[offset:], returning the code and the offset past it"""
+        max_length = data[offset]
+        offset += 1
+
+        lengths = []
+        for length in range(1, max_length + 1):
+            count, offset = _unpack_varint(data, offset)
+            lengths += [length] * count
+
+        if binary:
+            symbols = bytes(data[offset:offset+len(lengths)])
+            offset += len(lengths)
+        else:
+            sym_len, offset = _unpack_varint(data, offset)
+            symbols = bytes(data[offset:offset+sym_len]).decode('utf-8', 'surrogatepass')
+            offset += sym_len
+
+        if len(symbols) != len(lengths):
+            raise ValueError(f'Code table lists {len(lengths)} code lengths, '
+                             f'but {len(symbols)} symbols')
+
+        return cls(symbols, lengths, binary=binary), offset
+
+
+# Canonical-format data leads with a zero byte (a tree header begins with the
+# tree height, which is never zero -- empty input, whose tree would have no
+# height, is always written in the canonical format), followed by one of these
+# format bytes.
+FORMAT_CANONICAL = 1  # Characters of a str
+FORMAT_BYTES = 2      # Byte values of a bytes-like object
+FORMAT_UTF8 = 3       # Byte values of the UTF-8 encoding of a str
+FORMAT_DICT_BYTES = 4  # As FORMAT_BYTES, coded with a pre-trained dictionary
+FORMAT_DICT_UTF8 = 5   # As FORMAT_UTF8, coded with a pre-trained dictionary
+FORMAT_ADAPTIVE = 6    # As FORMAT_BYTES, coded adaptively with no code table
+FORMAT_ADAPTIVE_UTF8 = 7  # As FORMAT_UTF8, coded adaptively with no code table
+
+_BINARY_FORMATS = (FORMAT_BYTES, FORMAT_UTF8, FORMAT_DICT_BYTES, FORMAT_DICT_UTF8,
+                   FORMAT_ADAPTIVE, FORMAT_ADAPTIVE_UTF8)
+_UTF8_FORMATS = (FORMAT_UTF8, FORMAT_DICT_UTF8)
+_ADAPTIVE_FORMATS = (FORMAT_ADAPTIVE, FORMAT_ADAPTIVE_UTF8)
+
+# Data coded with a dictionary names it by ID, in place of a code table
+DICT_ID = struct.Struct('>I')
+
+
+# Inputs shorter than this aren't worth handing to NumPy
+NUMPY_MIN_SYMBOLS = 4096
+
+# Number of symbols packed per NumPy pass, bounding the temporary arrays
+NUMPY_CHUNK_SYMBOLS = 1 << 18
+
+# Tables indexed by code point are used for code points below this; past it
+# (say, for a single emoji), symbols are remapped to dense indices first
+NUMPY_MAX_TABLE_SIZE = 1 << 16
+
+
+def _symbol_array(source: Union[str, bytes]) -> 'np.ndarray':
+    """View a str as an array of code points, or bytes as an array of byte values"""
+    if isinstance(source, str):
+        return np.frombuffer(source.encode('utf-32-le', 'surrogatepass'), np.uint32)
+    return np.frombuffer(source, np.uint8)
+
+
+def _use_numpy(source: Union[str, bytes]) -> bool:
+    return np is not None and len(source) >= NUMPY_MIN_SYMBOLS
+
+
+def byte_counts(data: bytes) -> List[int]:
+    """Count the occurrences of each byte value, indexed by byte value"""
+    if _use_numpy(data):
+        return np.bincount(_symbol_array(data), minlength=256).tolist()
+
+    counts = [0] * 256
+    for byte, count in Counter(data).items():
+        counts[byte] = count
+    return counts
 
-    encoded = bitarray()
-    for c in source:
-        node = symbols[c]
-        encoded += node.bits
+
+def count_symbols(source: str) -> Dict[str, int]:
+    """Count the occurrences of each character"""
+    if _use_numpy(source):
+        syms = _symbol_array(source)
+        if int(syms.max()) < NUMPY_MAX_TABLE_SIZE:
+            counts = np.bincount(syms)
+            return {chr(sym): int(counts[sym]) for sym in np.flatnonzero(counts)}
+        uniques, counts = np.unique(syms, return_counts=True)
+        return dict(zip(map(chr, uniques.tolist()), counts.tolist()))
+    return Counter(source)
+
+
+def _pack_codes(syms: 'np.ndarray', aligned: 'np.ndarray', lengths: 'np.ndarray') -> Tuple[bytes, int]:
+    """Concatenate the codes of `syms`, returning the packed bytes and their bit length
+
+    `aligned[sym]` holds the code for `sym` in the top `lengths[sym]` bits of a
+    uint64. Each code's start bit is the running sum of the lengths before it;
+    shifting its aligned code right by the start's offset into its 64-bit word
+    places it within that word (dropping any bits which spill into the next).
+    Codes don't overlap, so OR-ing together every code starting in a word
+    builds the word, and each spilled remainder is OR-ed into the following
+    word. Every step is a whole-array operation.
+    """
+    sym_lengths = lengths[syms]
+    ends = np.cumsum(sym_lengths)
+    starts = ends - sym_lengths
+    nbits = int(ends[-1])
+
+    word = starts >> 6
+    offset = (starts & 63).astype(np.uint64)
+    sym_aligned = aligned[syms]
+
+    words = np.zeros((nbits + 63) // 64, np.uint64)
+    firsts = np.flatnonzero(np.concatenate(([True], word[1:] != word[:-1])))
+    words[word[firsts]] = np.bitwise_or.reduceat(sym_aligned >> offset, firsts)
+
+    spilled = np.flatnonzero(offset + sym_lengths.astype(np.uint64) > 64)
+    words[word[spilled] + 1] |= sym_aligned[spilled] << (np.uint64(64) - offset[spilled])
+
+    return words.astype('>u8').tobytes(), nbits
+
+
+def _encode_body_numpy(source: Union[str, bytes], codes: Dict[Symbol, bitarray]) -> bitarray:
+    syms = _symbol_array(source)
+    keys = {(ord(sym) if isinstance(sym, str) else sym): code for sym, code in codes.items()}
+
+    if max(keys) >= NUMPY_MAX_TABLE_SIZE:
+        # Index the tables by each symbol's rank among the coded symbols instead
+        ranked = np.array(sorted(keys), np.uint32)
+        syms = np.searchsorted(ranked, syms)
+        keys = {rank: keys[key] for rank, key in enumerate(ranked.tolist())}
+
+    size = max(max(keys), int(syms.max())) + 1
+    aligned = np.zeros(size, np.uint64)
+    lengths = np.zeros(size, np.int64)
+    for key, code in keys.items():
+        lengths[key] = len(code)
+        aligned[key] = int(code.to01(), 2) << (64 - len(code))
+
+    body = bitarray()
+    for start in range(0, len(syms), NUMPY_CHUNK_SYMBOLS):
+        packed, nbits = _pack_codes(syms[start:start+NUMPY_CHUNK_SYMBOLS], aligned, lengths)
+        chunk = bitarray()
+        chunk.frombytes(packed)
+        del chunk[nbits:]
+        body += chunk
+
+    return body
+
+
+def _encode_body(source: Union[str, bytes], codes: Dict[Symbol, bitarray]) -> bitarray:
+    if _use_numpy(source) and max(map(len, codes.values())) <= 64:
+        return _encode_body_numpy(source, codes)
+
+    # bitarray.encode() looks up each symbol's code without leaving C
+    body = bitarray()
+    if source:
+        body.encode(codes, source)
+    return body
+
+
+def encode(source: str, canonical: bool = False, utf8: bool = False,
+           dictionary: Optional['Dictionary'] = None,
+           max_code_length: Optional[int] = None,
+           adaptive: bool = False) -> bytes:
+    """Huffman-encode a string
+
+    By default, the code tree is written out in full. With canonical=True, only
+    the code lengths are written. With utf8=True, the UTF-8 encoding of the
+    string is encoded over the byte alphabet, like encode_bytes() -- which
+    keeps the header small and the encoding fast for non-Latin text.
+
+    Passing a `dictionary` implies utf8=True, and writes only the
+    dictionary's ID in place of a code table.
+
+    With max_code_length, no code is longer than that many bits (at some cost
+    in compression, if the optimal code has longer ones).
+
+    With adaptive=True, the UTF-8 encoding of the string is coded in a single
+    pass, with a code that adapts as it goes and no table; see AdaptiveEncoder.
+    """
+    if adaptive:
+        return AdaptiveEncoder().encode(source, final=True)
+
+    if dictionary is not None:
+        return dictionary.encode(FORMAT_DICT_UTF8, source.encode('utf-8'))
+
+    if utf8:
+        return _encode_bytes(FORMAT_UTF8, source.encode('utf-8'), max_code_length)
+
+    sym_counts = count_symbols(source)
+
+    # An empty tree would have height zero, which reads as the canonical marker
+    if canonical or not sym_counts:
+        return _encode_canonical(source, sym_counts, max_code_length)
+
+    if max_code_length is None:
+        codes = {sym: node.bits for sym, node in build_codes(sym_counts).items()}
+    else:
+        codes = CanonicalCode.from_counts(sym_counts, max_code_length=max_code_length).codes
+    height = max(map(len, codes.values()), default=0)
+
+    encoded = _encode_body(source, codes)
 
     lookup_table = bitarray()
-    for node in sorted(symbols.values(), key=lambda node: len(node.bits)):
-        lookup_table += len(node.bits) * bitarray('1')
+    for sym, bits in sorted(codes.items(), key=lambda item: len(item[1])):
+        lookup_table += len(bits) * bitarray('1')
         lookup_table.append(False)
-        lookup_table += node.bits
-        lookup_table.frombytes(node.sym.encode('latin-1'))  # TODO: utf-8
+        lookup_table += bits
+        lookup_table.frombytes(sym.encode('latin-1'))  # TODO: utf-8
 
-    header = struct.pack('BB', height, len(symbols))
+    header = struct.pack('BB', height, len(codes))
     body = lookup_table + encoded
 
     body_padlen = (8 - len(body) % 8) % 8
-    padding_mark = body_padlen * bitarray('1')
+    padding_mark = body_padlen * bitarray('1') + bitarray('0')
     padding_mark.fill()
 
-    compressed = header + (padding_mark + body)
+    compressed = header + (padding_mark + body).tobytes()
 
     return compressed
 
 
-def decode(encoded: bytes) -> str:
+def _encode_canonical(source: str, sym_counts: Dict[str, int],
+                      max_code_length: Optional[int] = None) -> bytes:
+    code = CanonicalCode.from_counts(sym_counts, max_code_length=max_code_length)
+    body = _encode_body(source, code.codes)
+    return _pack_canonical(FORMAT_CANONICAL, code, body)
+
+
+def encode_bytes(data: bytes, dictionary: Optional['Dictionary'] = None,
+                 max_code_length: Optional[int] = None, adaptive: bool = False) -> bytes:
+    """Huffman-encode a bytes-like object over the 256-symbol byte alphabet
+
+    Passing a `dictionary` writes only its ID in place of a code table.
+    max_code_length and adaptive are as for encode().
+    """
+    if adaptive:
+        return AdaptiveEncoder().encode(data, final=True)
+    if dictionary is not None:
+        return dictionary.encode(FORMAT_DICT_BYTES, data)
+    return _encode_bytes(FORMAT_BYTES, data, max_code_length)
+
+
+def _encode_bytes(fmt: int, data: bytes, max_code_length: Optional[int] = None) -> bytes:
+    code = CanonicalCode.from_byte_counts(byte_counts(data), max_code_length=max_code_length)
+    body = _encode_body(data, code.codes)
+    return _pack_canonical(fmt, code, body)
+
+
+def _pack_canonical(fmt: int, code: CanonicalCode, body: bitarray) -> bytes:
+    body_padlen = (8 - len(body) % 8) % 8
+
+    return b''.join([
+        bytes([0, fmt]),
+        code.pack(),
+        bytes([body_padlen]),
+        body.tobytes(),
+    ])
+
+
+class Dictionary:
+    """A static code over the byte alphabet, trained ahead of time on sample data
+
+    For short messages, a code table can easily outweigh the body it
+    describes. Coding with a dictionary which both ends already hold replaces
+    the table with the dictionary's 4-byte ID, and skips building a code (or
+    decode table) per message.
+
+    Every byte value gets a code, even those absent from the samples, so any
+    input can be encoded -- if not always compactly.
+    """
+
+    FILE_MAGIC = b'HUFD'
+
+    def __init__(self, code: CanonicalCode):
+        if not code.binary or len(code.symbols) != 256:
+            raise ValueError('A dictionary must code all 256 byte values')
+
+        self.code = code
+        self.packed = code.pack()
+        self.id = zlib.crc32(self.packed)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(id={self.id:#010x})'
+
+    @classmethod
+    def train(cls, samples: Iterable[Union[str, bytes]]) -> 'Dictionary':
+        """Build a dictionary from the byte frequencies over all `samples`
+
+        str samples are counted by their UTF-8 encoding.
+        """
+        counts = [1] * 256  # Laplace smoothing, so unseen bytes keep a code
+        for sample in samples:
+            if isinstance(sample, str):
+                sample = sample.encode('utf-8')
+            for byte, count in enumerate(byte_counts(sample)):
+                counts[byte] += count
+
+        return cls(CanonicalCode.from_byte_counts(counts))
+
+    def save(self, path: str):
+        with open(path, 'wb') as fp:
+            fp.write(self.FILE_MAGIC + self.packed)
+
+    @classmethod
+    def load(cls, path: str) -> 'Dictionary':
+        with open(path, 'rb') as fp:
+            data = fp.read()
+
+        if data[:len(cls.FILE_MAGIC)] != cls.FILE_MAGIC:
+            raise ValueError(f'{path} is not a Huffman dictionary')
+
+        code, _ = CanonicalCode.unpack(data, len(cls.FILE_MAGIC), binary=True)
+        return cls(code)
+
+    def encode(self, fmt: int, data: bytes) -> bytes:
+        body = _encode_body(data, self.code.codes)
+        body_padlen = (8 - len(body) % 8) % 8
+
+        return b''.join([
+            bytes([0, fmt]),
+            DICT_ID.pack(self.id),
+            bytes([body_padlen]),
+            body.tobytes(),
+        ])
+
+
+# Dictionaries available to decode() and decode_bytes(), by ID
+_dictionaries: Dict[int, Dictionary] = {}
+
+
+def register_dictionary(dictionary: Dictionary) -> int:
+    """Make a dictionary available for decoding by default, returning its ID"""
+    _dictionaries[dictionary.id] = dictionary
+    return dictionary.id
+
+
+# The bits of every byte value, most significant first
+_BYTE_BITS = tuple(
+    tuple(byte >> shift & 1 for shift in range(7, -1, -1))
+    for byte in range(256)
+)
+
+
+class DecodeTable:
+    """Decodes a Huffman-coded byte string a whole byte at a time
+
+    Walking the code tree bit-by-bit costs a lookup per bit. Instead, every
+    (partial code, input byte) pair is resolved once -- to the symbols which
+    complete within that byte, and the partial code left dangling after it --
+    and the result is memoized. Steady-state decoding is then a single list
+    index per 8 bits of input, however short the codes are.
+
+    Tree nodes are numbered, with the root at 0. `children[2*node + bit]` is
+    the next node index, ``~symbol_index`` for a leaf, or None if no code
+    takes that branch.
+    """
+
+    def __init__(self, codes: Dict[str, bitarray], empty: str = ''):
+        self.empty = empty
+        self.symbols: List[str] = []
+        self.children: List[Optional[int]] = [None, None]
+
+        for sym, code in codes.items():
+            self._insert(sym, code)
+
+        # One row of 256 memoized transitions per internal node, created on
+        # demand. The node index rides along in the last slot.
+        self._rows: List[Optional[list]] = [None] * (len(self.children) // 2)
+
+    def _insert(self, sym: str, code: bitarray):
+        if not code:
+            raise ValueError(f'Empty code for symbol {sym!r}')
+
+        children = self.children
+        node = 0
+        for bit in code[:-1]:
+            branch = 2 * node + bit
+            child = children[branch]
+            if child is None:
+                child = children[branch] = len(children) // 2
+                children += (None, None)
+            elif child < 0:
+                raise ValueError(f'Code for {sym!r} is prefixed by another code')
+            node = child
+
+        branch = 2 * node + code[-1]
+        if children[branch] is not None:
+            raise ValueError(f'Code for {sym!r} collides with another code')
+        children[branch] = ~len(self.symbols)
+        self.symbols.append(sym)
+
+    def _row(self, node: int) -> list:
+        row = self._rows[node]
+        if row is None:
+            row = self._rows[node] = [None] * 256 + [node]
+        return row
+
+    def _walk(self, node: int, byte: int, nbits: int = 8) -> Tuple[str, int]:
+        """Feed the top `nbits` bits of `byte` to the tree, starting at `node`"""
+        children = self.children
+        symbols = self.symbols
+        out = []
+        for bit in _BYTE_BITS[byte][:nbits]:
+            node = children[2 * node + bit]
+            if node is None:
+                raise ValueError('Encountered a bit sequence matching no code')
+            if node < 0:
+                out.append(symbols[~node])
+                node = 0
+        return self.empty.join(out), node
+
+    def _resolve(self, row: list, byte: int) -> tuple:
+        piece, node = self._walk(row[256], byte)
+        next_row = self._rows[node] or self._row(node)
+        hit = row[byte] = (piece, next_row)
+        return hit
+
+    def decode(self, data: bytes, nbits: Optional[int] = None) -> str:
+        """Decode `data`, of which only the first `nbits` bits are meaningful
+
+        If `nbits` is omitted, every bit of `data` is decoded.
+        """
+        if nbits is None:
+            nbits = len(data) * 8
+
+        whole, tail = divmod(nbits, 8)
+        view = memoryview(data)
+
+        decoded = []
+        decoded_append = decoded.append
+
+        if whole < 4 * len(self._rows):
+            # Too short for memoized transitions to pay for themselves
+            walk = self._walk
+            node = 0
+            for byte in view[:whole]:
+                piece, node = walk(node, byte)
+                decoded_append(piece)
+
+        else:
+            resolve = self._resolve
+            row = self._row(0)
+            for byte in view[:whole]:
+                hit = row[byte]
+                if hit is None:
+                    hit = resolve(row, byte)
+                piece, row = hit
+                decoded_append(piece)
+            node = row[256]
+
+        if tail:
+            piece, node = self._walk(node, view[whole], tail)
+            decoded_append(piece)
+
+        if node != 0:
+            raise ValueError('Encoded data ends partway through a code')
+
+        return self.empty.join(decoded)
+
+
+def decode(encoded: bytes, dictionaries: Optional[Mapping[int, Dictionary]] = None) -> str:
+    """Decode data produced by encode()
+
+    Data coded with a dictionary is decoded with the one of the same ID from
+    `dictionaries`, or else from those registered with register_dictionary().
+    """
+    if encoded[0] == 0:
+        if encoded[1] == FORMAT_ADAPTIVE_UTF8:
+            return AdaptiveDecoder().decode(encoded, final=True)
+        if encoded[1] in _UTF8_FORMATS:
+            return _decode_canonical(encoded, dictionaries).decode('utf-8')
+        if encoded[1] in _BINARY_FORMATS:
+            raise ValueError('Data was encoded from bytes; use decode_bytes()')
+        return _decode_canonical(encoded)
+
     height, num_syms = struct.unpack('BB', encoded[:2])
 
     bits = bitarray()
     bits.frombytes(encoded[2:])
 
-    padding_mark, bits = bits[:8], bits[8:]
-    while padding_mark.pop(0):
-        bits = bits[:-1]
+    padlen = bits.index(False, 0, 8)
 
-    nodes = {}
-    cur = 0
+    codes = {}
+    cur = 8
     for i in range(num_syms):
-        node = HuffNode()
+        bitlen = bits.index(False, cur) - cur
+        cur += bitlen + 1
 
-        bitlen = 0
-        for bit in bits[cur:]:
-            bitlen += bit
-            cur += 1
-            if not bit:
-                break
-
-        node.bits = bits[cur:cur+bitlen]
+        code = bits[cur:cur+bitlen]
         cur += bitlen
 
-        node.sym = bits[cur:cur+8].tobytes().decode('latin-1')  # TODO: utf-8
+        sym = bits[cur:cur+8].tobytes().decode('latin-1')  # TODO: utf-8
         cur += 8
 
-        nodes[tuple(node.bits)] = node
+        codes[sym] = code
+
+    body = bits[cur:len(bits)-padlen]
+    table = DecodeTable(codes)
+    return table.decode(body.tobytes(), len(body))
+
+
+def decode_bytes(encoded: bytes, dictionaries: Optional[Mapping[int, Dictionary]] = None) -> bytes:
+    """Decode data produced by encode_bytes() (or by encode() with utf8=True)"""
+    if encoded[0] != 0 or encoded[1] not in _BINARY_FORMATS:
+        raise ValueError('Data was not encoded from bytes; use decode()')
+    if encoded[1] in _ADAPTIVE_FORMATS:
+        return AdaptiveDecoder(binary=True).decode(encoded, final=True)
+    return _decode_canonical(encoded, dictionaries)
+
+
+def _decode_canonical(encoded: bytes,
+                      dictionaries: Optional[Mapping[int, Dictionary]] = None) -> Union[str, bytes]:
+    fmt = encoded[1]
+    if fmt in (FORMAT_DICT_BYTES, FORMAT_DICT_UTF8):
+        dict_id, = DICT_ID.unpack_from(encoded, 2)
+        dictionary = (_dictionaries if dictionaries is None else dictionaries).get(dict_id)
+        if dictionary is None:
+            raise KeyError(f'Data was coded with unknown dictionary {dict_id:#010x}')
+        code = dictionary.code
+        offset = 2 + DICT_ID.size
+
+    elif fmt in (FORMAT_CANONICAL, FORMAT_BYTES, FORMAT_UTF8):
+        code, offset = CanonicalCode.unpack(encoded, 2, binary=fmt != FORMAT_CANONICAL)
+
+    else:
+        raise ValueError(f'Unknown format {fmt}')
+
+    body_padlen = encoded[offset]
+    body = memoryview(encoded)[offset+1:]
+
+    return code.decode_table.decode(body, len(body) * 8 - body_padlen)
+
+
+# Streams are a series of frames, each holding an independently-encoded block
+# prefixed by its length in bytes.
+FRAME_HEADER = struct.Struct('>I')
+
+# Number of source characters encoded per frame
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+
+class HuffEncoder:
+    """Incrementally encodes a stream which needn't fit in memory
+
+    Input is buffered until a whole block is available, at which point the
+    block is encoded (with its own code table) and emitted as a frame. Memory
+    use is bounded by the block size, rather than the length of the stream.
+
+    Chunks may be str, or bytes-like (encoded as by encode_bytes()) -- but a
+    single stream mustn't mix the two. Text blocks use the canonical format,
+    which handles any characters; canonical=False selects the full-tree
+    format, which is limited to at most 255 distinct Latin-1 characters.
+    """
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE, canonical: bool = True):
+        if block_size < 1:
+            raise ValueError(f'block_size must be positive. Found: {block_size!r}')
+
+        self.block_size = block_size
+        self.canonical = canonical
+        self._pending = []
+        self._pending_len = 0
+
+    def encode(self, chunk: Union[str, bytes], final: bool = False) -> bytes:
+        """Feed `chunk` to the encoder, returning any frames completed by it
+
+        Pass final=True with the last chunk to flush any buffered input.
+        """
+        if chunk:
+            self._pending.append(chunk)
+            self._pending_len += len(chunk)
+
+        if self._pending_len < self.block_size and not (final and self._pending_len):
+            return b''
+
+        is_text = isinstance(self._pending[0], str)
+        pending = ('' if is_text else b'').join(self._pending)
+        end = len(pending) if final else len(pending) - len(pending) % self.block_size
+
+        frames = []
+        for start in range(0, end, self.block_size):
+            if is_text:
+                block = encode(pending[start:start+self.block_size], canonical=self.canonical)
+            else:
+                block = encode_bytes(pending[start:start+self.block_size])
+            frames.append(FRAME_HEADER.pack(len(block)))
+            frames.append(block)
+
+        remainder = pending[end:]
+        self._pending = [remainder] if remainder else []
+        self._pending_len = len(remainder)
+
+        return b''.join(frames)
+
+    def reset(self):
+        self._pending = []
+        self._pending_len = 0
+
+
+class HuffDecoder:
+    """Incrementally decodes a stream of frames produced by HuffEncoder
+
+    Data may be fed in arbitrarily-sized pieces; each frame is decoded as soon
+    as all of it has arrived, and only a partial frame is ever buffered.
+
+    Pass binary=True to decode a stream which was encoded from bytes.
+    """
+
+    def __init__(self, binary: bool = False):
+        self.binary = binary
+        self._buffer = bytearray()
+
+    def decode(self, data: bytes, final: bool = False) -> Union[str, bytes]:
+        """Feed `data` to the decoder, returning the contents of any completed frames
+
+        Pass final=True with the last piece of data to verify the stream
+        didn't end partway through a frame.
+        """
+        buffer = self._buffer
+        buffer += data
+
+        decode_block = decode_bytes if self.binary else decode
+
+        decoded = []
+        start = 0
+        while len(buffer) - start >= FRAME_HEADER.size:
+            block_len, = FRAME_HEADER.unpack_from(buffer, start)
+            block_start = start + FRAME_HEADER.size
+            block_end = block_start + block_len
+            if block_end > len(buffer):
+                break
+
+            decoded.append(decode_block(bytes(buffer[block_start:block_end])))
+            start = block_end
+
+        del buffer[:start]
+
+        if final and buffer:
+            raise ValueError(f'Stream ended partway through a frame ({len(buffer)} bytes left over)')
+
+        return (b'' if self.binary else '').join(decoded)
+
+    def reset(self):
+        self._buffer = bytearray()
+
+
+def encode_stream(reader, writer, block_size: int = DEFAULT_BLOCK_SIZE,
+                  canonical: bool = True):
+    """Encode everything read from `reader` into frames written to `writer`
+
+    `reader` need only provide read(size), and `writer` write(bytes) -- so
+    files (text or binary), or sockets wrapped by makefile(), will do.
+    """
+    encoder = HuffEncoder(block_size, canonical=canonical)
+    while True:
+        chunk = reader.read(block_size)
+        writer.write(encoder.encode(chunk, final=not chunk))
+        if not chunk:
+            break
+
+
+def decode_stream(reader, writer, read_size: int = DEFAULT_BLOCK_SIZE,
+                  binary: bool = False):
+    """Decode the frames read from `reader`, writing their contents to `writer`"""
+    decoder = HuffDecoder(binary=binary)
+    while True:
+        data = reader.read(read_size)
+        writer.write(decoder.decode(data, final=not data))
+        if not data:
+            break
+
+
+# Adaptive data has no code table: encoder and decoder start from the same
+# empty FGK tree and update it identically after every symbol. A symbol seen
+# for the first time is sent as the code of the "not yet transmitted" (NYT)
+# leaf, followed by the symbol itself in 9 bits, since the end of the data is
+# marked by a 257th symbol, ADAPTIVE_EOF. The header is only the leading zero
+# and format byte, so encoding is a single pass with no buffering.
+ADAPTIVE_EOF = 256
+ADAPTIVE_LITERAL_BITS = 9
+
+_ADAPTIVE_LITERALS = tuple(
+    tuple(bool(sym >> shift & 1) for shift in range(ADAPTIVE_LITERAL_BITS - 1, -1, -1))
+    for sym in range(ADAPTIVE_EOF + 1)
+)
+
+
+class AdaptiveTree:
+    """An FGK adaptive Huffman tree over the byte values, plus ADAPTIVE_EOF
+
+    Nodes are numbered so that weights never decrease with the number (the
+    sibling property), with the root numbered highest. Per-node state lives in
+    parallel arrays indexed by that number, so swapping two subtrees, to keep
+    the property as weights grow, exchanges their entries rather than
+    relinking objects.
+    """
+
+    __slots__ = ('weights', 'parents', 'lefts', 'rights', 'syms', 'leaves', 'root', 'nyt')
+
+    def __init__(self):
+        size = 2 * (ADAPTIVE_EOF + 1) + 1
+        self.weights = [0] * size
+        self.parents = [-1] * size
+        self.lefts = [-1] * size
+        self.rights = [-1] * size
+        self.syms = [-1] * size
+        self.leaves = [-1] * (ADAPTIVE_EOF + 1)
+        self.root = self.nyt = size - 1
+
+    def code(self, sym: int) -> List[bool]:
+        """Return the bits which transmit `sym`, given the tree's current state"""
+        node = self.leaves[sym]
+        bits = [] if node >= 0 else list(reversed(_ADAPTIVE_LITERALS[sym]))
+        if node < 0:
+            node = self.nyt
+
+        parents = self.parents
+        rights = self.rights
+        root = self.root
+        while node != root:
+            parent = parents[node]
+            bits.append(rights[parent] == node)
+            node = parent
+
+        bits.reverse()
+        return bits
+
+    def update(self, sym: int):
+        """Count one more occurrence of `sym`, restructuring the tree as needed"""
+        weights = self.weights
+        parents = self.parents
+        root = self.root
+
+        node = self.leaves[sym]
+        if node < 0:
+            # Split the NYT leaf into a new NYT leaf and a leaf for sym
+            parent = self.nyt
+            self.nyt = parent - 2
+            node = parent - 1
+            self.lefts[parent] = self.nyt
+            self.rights[parent] = node
+            parents[self.nyt] = parents[node] = parent
+            self.syms[node] = sym
+            self.leaves[sym] = node
+
+        while True:
+            # Move the node to the highest number of its weight class, so the
+            # increment can't leave it outweighing a higher-numbered node.
+            weight = weights[node]
+            leader = node
+            while leader < root and weights[leader + 1] == weight:
+                leader += 1
+
+            if leader != node and leader != parents[node]:
+                self._swap(node, leader)
+                node = leader
+
+            weights[node] += 1
+            if node == root:
+                break
+            node = parents[node]
+
+    def _swap(self, a: int, b: int):
+        """Exchange the subtrees numbered a and b, which keep their parents"""
+        lefts = self.lefts
+        rights = self.rights
+        syms = self.syms
+
+        lefts[a], lefts[b] = lefts[b], lefts[a]
+        rights[a], rights[b] = rights[b], rights[a]
+        syms[a], syms[b] = syms[b], syms[a]
+
+        for node in (a, b):
+            if lefts[node] >= 0:
+                self.parents[lefts[node]] = self.parents[rights[node]] = node
+            else:
+                self.leaves[syms[node]] = node
+
+
+class AdaptiveEncoder:
+    """Encodes data in a single pass with an adaptive code, emitting whole
+    bytes as soon as they're complete
+
+    Chunks may be str (encoded as UTF-8) or bytes-like -- but a single stream
+    mustn't mix the two.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def encode(self, chunk: Union[str, bytes], final: bool = False) -> bytes:
+        """Feed `chunk` to the encoder, returning the encoded bytes completed by it
+
+        Pass final=True with the last chunk to mark the end of the data.
+        """
+        header = b''
+        if self._is_text is None and (chunk or final):
+            self._is_text = isinstance(chunk, str)
+            header = bytes([0, FORMAT_ADAPTIVE_UTF8 if self._is_text else FORMAT_ADAPTIVE])
+
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+
+        tree = self._tree
+        bits = self._bits
+        for byte in chunk:
+            bits.extend(tree.code(byte))
+            tree.update(byte)
+
+        if final:
+            bits.extend(tree.code(ADAPTIVE_EOF))
+            bits.fill()
+
+        whole = len(bits) & ~7
+        encoded = bits[:whole].tobytes()
+        del bits[:whole]
+
+        if final:
+            self.reset()
+
+        return header + encoded
+
+    def reset(self):
+        self._tree = AdaptiveTree()
+        self._bits = bitarray()
+        self._is_text = None
+
+
+class AdaptiveDecoder:
+    """Incrementally decodes data produced by AdaptiveEncoder
+
+    Data may be fed in arbitrarily-sized pieces; each symbol is decoded as
+    soon as all of its bits have arrived.
+
+    Pass binary=True to decode data which was encoded from bytes (or to
+    decode text to its UTF-8 encoding, rather than to str).
+    """
+
+    def __init__(self, binary: bool = False):
+        self.binary = binary
+        self.reset()
+
+    def decode(self, data: bytes, final: bool = False) -> Union[str, bytes]:
+        """Feed `data` to the decoder, returning the data decoded from it
+
+        Pass final=True with the last piece of data to verify the data didn't
+        end before its end-of-data mark.
+        """
+        if self._finished:
+            if data:
+                raise ValueError('Data continues past its end-of-data mark')
+            return self._output(b'', final)
+
+        if self._header is not None:
+            self._header += data
+            if len(self._header) < 2:
+                if final:
+                    raise ValueError('Data ended before its header')
+                return self._output(b'', final)
+
+            if self._header[0] != 0 or self._header[1] not in _ADAPTIVE_FORMATS:
+                raise ValueError('Data was not encoded with an adaptive code')
+
+            if self._header[1] == FORMAT_ADAPTIVE and not self.binary:
+                raise ValueError('Data was encoded from bytes; pass binary=True')
+            data = self._header[2:]
+            self._header = None
+
+        bits = self._bits
+        bits.frombytes(bytes(data))
+
+        tree = self._tree
+        lefts = tree.lefts
+        rights = tree.rights
+        syms = tree.syms
+        end = len(bits)
+
+        decoded = bytearray()
+        pos = 0
+        while True:
+            start = pos
+            node = tree.root
+            while lefts[node] >= 0 and pos < end:
+                node = rights[node] if bits[pos] else lefts[node]
+                pos += 1
+            if lefts[node] >= 0:
+                break
+
+            if node == tree.nyt:
+                if pos + ADAPTIVE_LITERAL_BITS > end:
+                    break
+                sym = ba2int(bits[pos:pos+ADAPTIVE_LITERAL_BITS])
+                pos += ADAPTIVE_LITERAL_BITS
+            else:
+                sym = syms[node]
+
+            if sym == ADAPTIVE_EOF:
+                if bits[pos:].any() or end - pos >= 8:
+                    raise ValueError('Data continues past its end-of-data mark')
+                self._finished = True
+                break
+
+            decoded.append(sym)
+            tree.update(sym)
+
+        if self._finished:
+            bits.clear()
+        else:
+            del bits[:start]
+            if final:
+                raise ValueError('Data ended before its end-of-data mark')
+
+        return self._output(bytes(decoded), final)
+
+    def _output(self, decoded: bytes, final: bool) -> Union[str, bytes]:
+        if self.binary:
+            return decoded
+        return self._text.decode(decoded, final)
+
+    def reset(self):
+        self._tree = AdaptiveTree()
+        self._bits = bitarray()
+        self._header = b''
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._finished = False
+
+
+# Containers hold a whole input, split into blocks which can be encoded and
+# decoded independently -- and so, in parallel. After the magic comes a flags
+# byte; then, if the blocks share a code table, the table; then one frame per
+# block, as in a stream.
+CONTAINER_MAGIC = b'HUFC'
+CONTAINER_BINARY = 0x01  # Blocks were encoded from bytes
+CONTAINER_SHARED = 0x02  # Blocks hold only a body, coded with the shared table
+_CONTAINER_FLAGS = CONTAINER_BINARY | CONTAINER_SHARED
+
+# Number of source symbols per container block
+DEFAULT_CONTAINER_BLOCK_SIZE = 1 << 20
+
+
+def _count_block(block: Union[str, bytes]):
+    return Counter(count_symbols(block)) if isinstance(block, str) else byte_counts(block)
+
+
+def _encode_block(block: Union[str, bytes]) -> bytes:
+    return encode(block, canonical=True) if isinstance(block, str) else encode_bytes(block)
+
+
+def _decode_block(args: Tuple[bytes, bool]) -> Union[str, bytes]:
+    block, binary = args
+    return decode_bytes(block) if binary else decode(block)
+
+
+@lru_cache(maxsize=16)
+def _unpack_shared_code(packed: bytes, binary: bool) -> CanonicalCode:
+    code, _ = CanonicalCode.unpack(packed, binary=binary)
+    return code
+
+
+def _encode_shared_block(args: Tuple[bytes, Union[str, bytes]]) -> bytes:
+    packed, block = args
+    code = _unpack_shared_code(packed, not isinstance(block, str))
+    body = _encode_body(block, code.codes)
+    body_padlen = (8 - len(body) % 8) % 8
+    return bytes([body_padlen]) + body.tobytes()
+
+
+def _decode_shared_block(args: Tuple[bytes, bool, bytes]) -> Union[str, bytes]:
+    packed, binary, block = args
+    code = _unpack_shared_code(packed, binary)
+    body = memoryview(block)[1:]
+    return code.decode_table.decode(body, len(body) * 8 - block[0])
+
+
+def _pool_map(executor: Optional[Executor], fn, items: list) -> list:
+    if executor is None:
+        return list(map(fn, items))
+    return list(executor.map(fn, items))
+
+
+def _make_executor(max_workers: Optional[int], num_blocks: int) -> Optional[Executor]:
+    if num_blocks <= 1 or max_workers == 1:
+        return None
+    return ProcessPoolExecutor(max_workers)
+
+
+def encode_blocks(source: Union[str, bytes],
+                  block_size: int = DEFAULT_CONTAINER_BLOCK_SIZE,
+                  shared_table: bool = False,
+                  max_workers: Optional[int] = None) -> bytes:
+    """Encode `source` as a container of blocks, spread over a process pool
+
+    Each block gets its own canonical code table, unless shared_table=True --
+    then symbols are counted over the whole input (also in parallel), and a
+    single table is written up front. The container body of a non-shared
+    container is a valid stream for HuffDecoder.
+
+    max_workers=1 encodes every block in this process.
+    """
+    if block_size < 1:
+        raise ValueError(f'block_size must be positive. Found: {block_size!r}')
+
+    binary = not isinstance(source, str)
+    blocks = [source[start:start+block_size] for start in range(0, len(source), block_size)]
+
+    flags = CONTAINER_BINARY if binary else 0
+    header = [CONTAINER_MAGIC]
+
+    executor = _make_executor(max_workers, len(blocks))
+    try:
+        if shared_table:
+            flags |= CONTAINER_SHARED
+            block_counts = _pool_map(executor, _count_block, blocks)
+            if binary:
+                code = CanonicalCode.from_byte_counts([sum(counts) for counts in zip(*block_counts)])
+            else:
+                code = CanonicalCode.from_counts(sum(block_counts, Counter()))
+
+            packed = code.pack()
+            header.append(bytes([flags]))
+            header.append(packed)
+            encoded = _pool_map(executor, _encode_shared_block, [(packed, block) for block in blocks])
+
+        else:
+            header.append(bytes([flags]))
+            encoded = _pool_map(executor, _encode_block, blocks)
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    frames = []
+    for block in encoded:
+        frames.append(FRAME_HEADER.pack(len(block)))
+        frames.append(block)
+
+    return b''.join(header + frames)
+
+
+def decode_blocks(encoded: bytes, max_workers: Optional[int] = None) -> Union[str, bytes]:
+    """Decode a container produced by encode_blocks(), spread over a process pool"""
+    if encoded[:len(CONTAINER_MAGIC)] != CONTAINER_MAGIC:
+        raise ValueError('Missing container magic')
+
+    offset = len(CONTAINER_MAGIC)
+    flags = encoded[offset]
+    offset += 1
+    if flags & ~_CONTAINER_FLAGS:
+        raise ValueError(f'Unknown container flags {flags & ~_CONTAINER_FLAGS:#04x}')
+
+    binary = bool(flags & CONTAINER_BINARY)
+    packed = None
+    if flags & CONTAINER_SHARED:
+        _, end = CanonicalCode.unpack(encoded, offset, binary=binary)
+        packed = bytes(encoded[offset:end])
+        offset = end
+
+    blocks = []
+    while offset < len(encoded):
+        block_len, = FRAME_HEADER.unpack_from(encoded, offset)
+        offset += FRAME_HEADER.size
+        if offset + block_len > len(encoded):
+            raise ValueError('Container ended partway through a block')
+
+        blocks.append(bytes(encoded[offset:offset+block_len]))
+        offset += block_len
+
+    executor = _make_executor(max_workers, len(blocks))
+    try:
+        if packed is not None:
+            decoded = _pool_map(executor, _decode_shared_block,
+                                [(packed, binary, block) for block in blocks])
+        else:
+            decoded = _pool_map(executor, _decode_block,
+                                [(block, binary) for block in blocks])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return (b'' if binary else '').join(decoded)
+
+
+def _release_pages(mm: mmap.mmap, start: int, end: int):
+    """Let the kernel drop the already-processed pages of a read-only mapping
+
+    They're backed by the file, so this only forgets them; without it, a
+    sequential pass over a large file leaves all of it resident.
+    """
+    if not hasattr(mm, 'madvise'):
+        return
+
+    start -= start % mmap.PAGESIZE
+    end -= end % mmap.PAGESIZE
+    if end > start:
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def compress_file(src_path: str, dst_path: str, block_size: int = DEFAULT_CONTAINER_BLOCK_SIZE) -> Tuple[int, int]:
+    """Compress a file as a stream of byte-alphabet frames, returning the sizes read and written
+
+    The source is memory-mapped and encoded a block at a time, with each
+    frame written as soon as it's encoded -- so neither file is ever held in
+    memory whole.
+    """
+    written = 0
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        if not size:
+            return 0, 0
+
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, size, block_size):
+                    block = encode_bytes(view[start:start+block_size])
+                    dst.write(FRAME_HEADER.pack(len(block)))
+                    dst.write(block)
+                    written += FRAME_HEADER.size + len(block)
+                    _release_pages(mm, 0, start + block_size)
+            finally:
+                view.release()
+
+    return size, written
+
+
+def decompress_file(src_path: str, dst_path: str) -> Tuple[int, int]:
+    """Decompress a file written by compress_file(), returning the sizes read and written"""
+    written = 0
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        if not size:
+            return 0, 0
+
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                offset = 0
+                while offset < size:
+                    if offset + FRAME_HEADER.size > size:
+                        raise ValueError('File ends partway through a frame header')
+                    block_len, = FRAME_HEADER.unpack_from(view, offset)
+                    offset += FRAME_HEADER.size
+
+                    if offset + block_len > size:
+                        raise ValueError('File ends partway through a frame')
+                    decoded = decode_bytes(view[offset:offset+block_len])
+                    offset += block_len
+
+                    dst.write(decoded)
+                    written += len(decoded)
+                    _release_pages(mm, 0, offset)
+            finally:
+                view.release()
+
+    return size, written
+
+
+def _peak_rss() -> Optional[int]:
+    """Peak resident set size of this process, in bytes, or None where the
+    platform (e.g. Windows) has no resource module"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Huffman-compress or decompress a file')
+    parser.add_argument('mode', choices=('compress', 'decompress'),
+                        help='Whether to compress or decompress the input')
+    parser.add_argument('input', help='File to read')
+    parser.add_argument('output', help='File to write')
+    parser.add_argument('-b', '--block-size', default=DEFAULT_CONTAINER_BLOCK_SIZE,
+                        type=int, help='Number of input bytes encoded per frame')
 
-    decoded = []
-    buf = ()
+    args = parser.parse_args(argv[1:])
 
-    nodes_get = nodes.get
-    decoded_append = decoded.append
+    started = time.perf_counter()
+    if args.mode == 'compress':
+        read, written = compress_file(args.input, args.output, args.block_size)
+        raw_size = read
+    else:
+        read, written = decompress_file(args.input, args.output)
+        raw_size = written
+    elapsed = time.perf_counter() - started
 
-    for bit in bits[cur:]:
-        buf += (bit,)
+    throughput = raw_size / elapsed / 1e6 if elapsed else float('inf')
+    peak_rss = _peak_rss()
+    memory = f', peak RSS {peak_rss / 1e6:.1f} MB' if peak_rss is not None else ''
+    print(f'{args.mode.capitalize()}ed {read} bytes to {written} bytes '
+          f'in {elapsed:.2f}s ({throughput:.1f} MB/s){memory}',
+          file=sys.stderr)
 
-        node = nodes_get(buf)
-        if node:
-            decoded_append(node.sym)
-            buf = ()
 
-    return ''.join(decoded)
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,123 @@
+"""asyncio adapters for the huff codec
+
+Messages travel as the frames of a huff stream -- each a big-endian 32-bit
+length, then an independently-encoded block -- so a HuffDecoder (or
+decode_stream()) on the far end can read what a HuffStreamWriter writes.
+
+Encoding and decoding are CPU-bound, so any message of OFFLOAD_MIN_SIZE bytes
+or more is handed to an executor, leaving the event loop free to serve other
+connections meanwhile. By default that's the loop's default (thread)
+executor; as the codec is pure Python, pass a ProcessPoolExecutor to also
+keep large messages from contending for the GIL.
+"""
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Optional, Union
+
+import huff
+from huff import FRAME_HEADER
+
+# Messages smaller than this are coded inline, as it's quicker than a round
+# trip through the executor
+OFFLOAD_MIN_SIZE = 1 << 14
+
+# Largest encoded message a reader accepts by default. A frame's length comes
+# from the peer, so it's checked before that many bytes are buffered.
+DEFAULT_MAX_MESSAGE_SIZE = 1 << 26
+
+
+async def _run(executor: Optional[Executor], size: int, fn, *args):
+    if size < OFFLOAD_MIN_SIZE:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, fn, *args)
+
+
+class HuffStreamReader:
+    """Reads and decodes framed messages from an asyncio.StreamReader
+
+    Pass binary=True to read messages which were encoded from bytes.
+    Messages longer than max_message_size bytes, encoded, are refused.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, binary: bool = False,
+                 executor: Optional[Executor] = None,
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE):
+        self.reader = reader
+        self.binary = binary
+        self.executor = executor
+        self.max_message_size = max_message_size
+
+    async def read_message(self) -> Union[str, bytes]:
+        """Read and decode the next message
+
+        Raises asyncio.IncompleteReadError if the stream ends before a whole
+        message has arrived (with `partial` empty if it ended between them),
+        and ValueError if the next message is longer than max_message_size.
+        """
+        header = await self.reader.readexactly(FRAME_HEADER.size)
+        block_len, = FRAME_HEADER.unpack(header)
+        if block_len > self.max_message_size:
+            raise ValueError(f'Message of {block_len} bytes exceeds the limit of '
+                             f'{self.max_message_size} bytes')
+        block = await self.reader.readexactly(block_len)
+
+        decode_block = huff.decode_bytes if self.binary else huff.decode
+        return await _run(self.executor, block_len, decode_block, block)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Union[str, bytes]:
+        try:
+            return await self.read_message()
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+            raise StopAsyncIteration
+
+
+class HuffStreamWriter:
+    """Encodes and writes framed messages to an asyncio.StreamWriter
+
+    str messages are encoded as by huff.encode() (with `canonical`), and
+    bytes-like ones as by huff.encode_bytes().
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, canonical: bool = True,
+                 executor: Optional[Executor] = None):
+        self.writer = writer
+        self.canonical = canonical
+        self.executor = executor
+
+    async def write_message(self, message: Union[str, bytes]):
+        """Encode and write `message`, waiting for the transport to drain"""
+        if isinstance(message, str):
+            encode_block = partial(huff.encode, canonical=self.canonical)
+        else:
+            encode_block = huff.encode_bytes
+
+        block = await _run(self.executor, len(message), encode_block, message)
+
+        self.writer.write(FRAME_HEADER.pack(len(block)))
+        self.writer.write(block)
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+    async def wait_closed(self):
+        await self.writer.wait_closed()
+
+
+async def open_connection(host: str = None, port: int = None, binary: bool = False,
+                          canonical: bool = True, executor: Optional[Executor] = None,
+                          max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE, **kwargs):
+    """Like asyncio.open_connection(), returning a HuffStreamReader and HuffStreamWriter"""
+    reader, writer = await asyncio.open_connection(host, port, **kwargs)
+    return (
+        HuffStreamReader(reader, binary=binary, executor=executor,
+                         max_message_size=max_message_size),
+        HuffStreamWriter(writer, canonical=canonical, executor=executor),
+    )
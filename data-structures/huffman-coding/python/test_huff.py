@@ -1,6 +1,9 @@
+import io
+from collections import Counter
 from typing import Tuple
 
 import pytest
+from bitarray import bitarray
 
 import huff
 
@@ -147,3 +150,444 @@ def test_decoding_encoded_string_equals_source(source: str, benchmark):
     expected = source
     actual = decoded
     assert expected == actual
+
+
+@pytest.mark.parametrize('source', [
+    'a',
+    'aaaaaaaa',
+    'ab',
+    'abababababababab',
+    pytest.param(''.join(chr(ord('a') + i % 7) for i in range(1, 1000)), id='cyclic'),
+])
+def test_decoding_edge_cases(source: str):
+    expected = source
+    actual = huff.decode(huff.encode(source))
+    assert expected == actual
+
+
+def test_decode_table_rejects_unknown_codes():
+    table = huff.DecodeTable({'a': bitarray('0'), 'b': bitarray('10')})
+
+    with pytest.raises(ValueError):
+        table.decode(b'\xff')
+
+
+@pytest.mark.parametrize('block_size,chunk_size', [
+    (1, 1),
+    (7, 3),
+    (64, 1000),
+    (4096, 97),
+])
+def test_streaming_roundtrip(block_size: int, chunk_size: int):
+    source = ''.join(chr(ord('a') + (i * i) % 23) for i in range(3000))
+
+    encoder = huff.HuffEncoder(block_size)
+    encoded = b''.join(
+        encoder.encode(source[i:i+chunk_size])
+        for i in range(0, len(source), chunk_size)
+    ) + encoder.encode('', final=True)
+
+    decoder = huff.HuffDecoder()
+    decoded = ''.join(
+        decoder.decode(encoded[i:i+chunk_size])
+        for i in range(0, len(encoded), chunk_size)
+    ) + decoder.decode(b'', final=True)
+
+    expected = source
+    actual = decoded
+    assert expected == actual
+
+
+def test_streaming_file_roundtrip():
+    source = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n' * 200
+
+    encoded = io.BytesIO()
+    huff.encode_stream(io.StringIO(source), encoded, block_size=512)
+
+    decoded = io.StringIO()
+    huff.decode_stream(io.BytesIO(encoded.getvalue()), decoded, read_size=100)
+
+    expected = source
+    actual = decoded.getvalue()
+    assert expected == actual
+
+
+@pytest.mark.parametrize('source', [
+    'Ünïcödé — ✓ 😀\n' * 100,
+    ''.join(map(chr, range(32, 2000))) * 2,
+], ids=['non-latin-1', 'many-symbols'])
+def test_streaming_file_roundtrip_any_text(source: str):
+    encoded = io.BytesIO()
+    huff.encode_stream(io.StringIO(source), encoded, block_size=1000)
+
+    decoded = io.StringIO()
+    huff.decode_stream(io.BytesIO(encoded.getvalue()), decoded, read_size=100)
+
+    expected = source
+    actual = decoded.getvalue()
+    assert expected == actual
+
+
+def test_streaming_decoder_rejects_truncated_frames():
+    encoder = huff.HuffEncoder()
+    encoded = encoder.encode('Hello, there!', final=True)
+
+    decoder = huff.HuffDecoder()
+    with pytest.raises(ValueError):
+        decoder.decode(encoded[:-1], final=True)
+
+
+@pytest.mark.parametrize('source', [
+    '',
+    'a',
+    'Hello, there!',
+    'I am a pretty, pretty princess',
+    pytest.param('Ünïcödé — ✓ 😀 ' * 10, id='unicode'),
+    pytest.param(''.join(map(chr, range(0x100, 0x500))) * 3, id='1024-symbols'),
+])
+def test_canonical_roundtrip(source: str):
+    expected = source
+    actual = huff.decode(huff.encode(source, canonical=True))
+    assert expected == actual
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'canonical': True},
+    {'utf8': True},
+    {'max_code_length': 4},
+    {'adaptive': True},
+    {'dictionary': huff.Dictionary.train(['Hello, there!'])},
+])
+def test_empty_roundtrip(kwargs):
+    encoded = huff.encode('', **kwargs)
+    dictionary = kwargs.get('dictionary')
+    dictionaries = {dictionary.id: dictionary} if dictionary else None
+    assert huff.decode(encoded, dictionaries) == ''
+
+    if 'canonical' not in kwargs and 'utf8' not in kwargs:
+        encoded = huff.encode_bytes(b'', **kwargs)
+        assert huff.decode_bytes(encoded, dictionaries) == b''
+
+
+@pytest.mark.parametrize('source', ['Hello, there!', 'I am a pretty, pretty princess'])
+def test_canonical_header_is_smaller(source: str):
+    assert len(huff.encode(source, canonical=True)) < len(huff.encode(source))
+
+
+def test_canonical_code_is_rebuilt_from_lengths():
+    code = huff.CanonicalCode.from_lengths({'a': 1, 'b': 2, 'c': 3, 'd': 3})
+
+    expected = {
+        'a': bitarray('0'),
+        'b': bitarray('10'),
+        'c': bitarray('110'),
+        'd': bitarray('111'),
+    }
+    actual = code.codes
+    assert expected == actual
+
+    unpacked, _ = huff.CanonicalCode.unpack(code.pack())
+    assert expected == unpacked.codes
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'\x00',
+    b'\x00\xff' * 100,
+    bytes(range(256)) * 4,
+    pytest.param(bytes((i * 7919) % 251 for i in range(5000)), id='pseudorandom'),
+])
+def test_bytes_roundtrip(data: bytes):
+    expected = data
+    actual = huff.decode_bytes(huff.encode_bytes(data))
+    assert expected == actual
+
+
+@pytest.mark.parametrize('source', [
+    'Hello, there!',
+    pytest.param('Съешь же ещё этих мягких французских булок, да выпей чаю', id='cyrillic'),
+    pytest.param('素早い茶色の狐がのろまな犬を飛び越える 😀', id='cjk-emoji'),
+])
+def test_utf8_roundtrip(source: str):
+    encoded = huff.encode(source, utf8=True)
+
+    assert source == huff.decode(encoded)
+    assert source.encode('utf-8') == huff.decode_bytes(encoded)
+
+
+def test_streaming_bytes_roundtrip():
+    data = bytes((i * i) % 251 for i in range(10000))
+
+    encoded = io.BytesIO()
+    huff.encode_stream(io.BytesIO(data), encoded, block_size=1000)
+
+    decoded = io.BytesIO()
+    huff.decode_stream(io.BytesIO(encoded.getvalue()), decoded, read_size=333, binary=True)
+
+    expected = data
+    actual = decoded.getvalue()
+    assert expected == actual
+
+
+@pytest.mark.parametrize('shared_table', [False, True], ids=['own-tables', 'shared-table'])
+@pytest.mark.parametrize('source', [
+    pytest.param('Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 300, id='str'),
+    pytest.param(bytes((i * i) % 251 for i in range(20000)), id='bytes'),
+])
+def test_blocks_roundtrip(source, shared_table: bool):
+    encoded = huff.encode_blocks(source, block_size=4096, shared_table=shared_table, max_workers=2)
+
+    expected = source
+    actual = huff.decode_blocks(encoded, max_workers=2)
+    assert expected == actual
+
+
+def test_blocks_rejects_unknown_flags():
+    encoded = bytearray(huff.encode_blocks('Hello, there!', max_workers=1))
+    encoded[len(huff.CONTAINER_MAGIC)] |= 0x80
+
+    with pytest.raises(ValueError):
+        huff.decode_blocks(bytes(encoded), max_workers=1)
+
+
+def test_blocks_container_body_is_a_stream():
+    source = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 300
+    encoded = huff.encode_blocks(source, block_size=4096, max_workers=1)
+
+    decoder = huff.HuffDecoder()
+    body = encoded[len(huff.CONTAINER_MAGIC) + 1:]
+
+    expected = source
+    actual = decoder.decode(body, final=True)
+    assert expected == actual
+
+
+@pytest.mark.skipif(huff.np is None, reason='NumPy is not installed')
+@pytest.mark.parametrize('source,kwargs', [
+    pytest.param('Lorem ipsum dolor sit amet. ' * 20000, {}, id='tree'),
+    pytest.param('Lorem ipsum dolor sit amet. ' * 20000, {'canonical': True}, id='canonical'),
+    pytest.param('Ünïcödé — ✓ 😀 ' * 20000, {'canonical': True}, id='canonical-unicode'),
+    pytest.param('Ünïcödé — ✓ 😀 ' * 20000, {'utf8': True}, id='utf8'),
+    pytest.param(''.join(chr(0x1F600 + i * i % 40) for i in range(50000)), {'canonical': True},
+                 id='astral'),
+    pytest.param(bytes((i * i) % 251 for i in range(500000)), None, id='bytes'),
+])
+def test_numpy_encoding_matches_fallback(source, kwargs, monkeypatch):
+    encode = huff.encode_bytes if kwargs is None else lambda s: huff.encode(s, **kwargs)
+
+    vectorized = encode(source)
+    monkeypatch.setattr(huff, 'np', None)
+    fallback = encode(source)
+
+    assert fallback == vectorized
+
+
+@pytest.mark.skipif(huff.np is None, reason='NumPy is not installed')
+@pytest.mark.parametrize('source', [
+    'Lorem ipsum dolor sit amet. ' * 1000,
+    'Lorem ipsum dolor sit amet 😀 ' * 1000,
+])
+def test_numpy_counts_match_counter(source):
+    assert huff.count_symbols(source) == Counter(source)
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'Hello, there!',
+    pytest.param(bytes((i * i) % 251 for i in range(100000)), id='pseudorandom'),
+])
+def test_file_roundtrip(data: bytes, tmp_path):
+    src = tmp_path / 'src.bin'
+    compressed = tmp_path / 'src.bin.huf'
+    decompressed = tmp_path / 'decompressed.bin'
+    src.write_bytes(data)
+
+    huff.compress_file(str(src), str(compressed), block_size=8192)
+    huff.decompress_file(str(compressed), str(decompressed))
+
+    expected = data
+    actual = decompressed.read_bytes()
+    assert expected == actual
+
+
+def test_cli_reports_throughput_and_memory(tmp_path, capsys):
+    src = tmp_path / 'src.txt'
+    compressed = tmp_path / 'src.txt.huf'
+    src.write_bytes(b'Lorem ipsum dolor sit amet. ' * 1000)
+
+    huff.main(['huff.py', 'compress', str(src), str(compressed)])
+
+    report = capsys.readouterr().err
+    assert 'Compressed 28000 bytes to ' in report
+    assert 'MB/s' in report
+    assert 'peak RSS' in report
+
+
+GREETINGS = [
+    'Hello, there!',
+    'General Kenobi! You are a bold one.',
+    'Hello, hello, is there anybody in there?',
+]
+
+
+@pytest.mark.parametrize('source', [
+    '',
+    'Hello, there!',
+    'Anything else, even Ünïcödé 🎉',
+])
+def test_dictionary_roundtrip(source: str):
+    dictionary = huff.Dictionary.train(GREETINGS)
+    encoded = huff.encode(source, dictionary=dictionary)
+
+    expected = source
+    actual = huff.decode(encoded, {dictionary.id: dictionary})
+    assert expected == actual
+
+    encoded = huff.encode_bytes(source.encode('utf-8'), dictionary=dictionary)
+    assert huff.decode_bytes(encoded, {dictionary.id: dictionary}) == source.encode('utf-8')
+
+
+def test_dictionary_shrinks_short_messages():
+    dictionary = huff.Dictionary.train(GREETINGS)
+    source = 'Hello, there!'
+
+    encoded = huff.encode(source, dictionary=dictionary)
+    assert len(encoded) < len(huff.encode(source, canonical=True))
+    assert len(encoded) < len(huff.encode(source, utf8=True))
+
+
+def test_dictionary_save_load_register(tmp_path, monkeypatch):
+    monkeypatch.setattr(huff, '_dictionaries', {})
+    path = str(tmp_path / 'greetings.hufd')
+    huff.Dictionary.train(GREETINGS).save(path)
+
+    dictionary = huff.Dictionary.load(path)
+    encoded = huff.encode('Hello, there!', dictionary=dictionary)
+
+    with pytest.raises(KeyError):
+        huff.decode(encoded)
+
+    huff.register_dictionary(dictionary)
+    assert huff.decode(encoded) == 'Hello, there!'
+
+    # An explicitly empty mapping doesn't fall back to the registered ones
+    with pytest.raises(KeyError):
+        huff.decode(encoded, {})
+
+
+def test_tree_nodes_walk_like_huff_nodes():
+    sym_counts = huff.count_symbols('I am a pretty, pretty princess')
+    leaves = huff.build_codes(sym_counts)
+    tree = huff.HuffTree(sym_counts)
+    root = tree.node(tree.root, bitarray())
+    assert float(root) == 1.0
+
+    to_visit = [root]
+    while to_visit:
+        node = to_visit.pop()
+        if node.is_leaf:
+            assert leaves[node.sym].bits == node.bits
+        else:
+            assert float(node) == pytest.approx(float(node[0]) + float(node[1]))
+            assert node[0] <= node[1]
+            to_visit.extend([node.left, node.right])
+
+    with pytest.raises(ValueError):
+        root[2]
+
+
+@pytest.mark.parametrize('num_symbols', [1, 2, 3, 300])
+def test_tree_code_lengths_are_complete(num_symbols: int):
+    lengths = huff.HuffTree({i: i % 7 + 1 for i in range(num_symbols)}).lengths()
+
+    assert len(lengths) == num_symbols
+    assert sum(2 ** -length for length in lengths.values()) == (0.5 if num_symbols == 1 else 1)
+
+
+FIBONACCI_COUNTS = {chr(ord('a') + i): count for i, count in enumerate(
+    [1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610, 987, 1597, 2584, 4181, 6765])}
+
+
+@pytest.mark.parametrize('max_code_length', [5, 8, 12, 19, 30])
+def test_limited_code_lengths(max_code_length: int):
+    lengths = huff.limited_code_lengths(FIBONACCI_COUNTS, max_code_length)
+
+    assert max(lengths.values()) == min(max_code_length, 19)
+    assert sum(2 ** -length for length in lengths.values()) == 1
+
+    # With room for the unlimited code, it is as cheap as that one
+    if max_code_length >= 19:
+        unlimited = huff.HuffTree(FIBONACCI_COUNTS).lengths()
+        cost = sum(FIBONACCI_COUNTS[sym] * lengths[sym] for sym in lengths)
+        assert cost == sum(FIBONACCI_COUNTS[sym] * unlimited[sym] for sym in unlimited)
+
+
+def test_limited_code_lengths_need_room_for_every_symbol():
+    with pytest.raises(ValueError):
+        huff.limited_code_lengths(FIBONACCI_COUNTS, 4)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'canonical': True}, {'utf8': True}])
+def test_length_limited_roundtrip(kwargs):
+    source = ''.join(sym * count for sym, count in FIBONACCI_COUNTS.items())
+    encoded = huff.encode(source, max_code_length=8, **kwargs)
+
+    expected = source
+    actual = huff.decode(encoded)
+    assert expected == actual
+
+    if encoded[0] != 0:
+        assert encoded[0] == 8  # Tree height
+    else:
+        code, _ = huff.CanonicalCode.unpack(encoded, 2, binary=encoded[1] != huff.FORMAT_CANONICAL)
+        assert code.max_length == 8
+
+
+@pytest.mark.parametrize('source', [
+    '',
+    'a',
+    'Hello, there!',
+    'I am a pretty, pretty princess',
+    'Ünïcödé 🎉' * 50,
+])
+def test_adaptive_roundtrip(source: str):
+    encoded = huff.encode(source, adaptive=True)
+
+    expected = source
+    actual = huff.decode(encoded)
+    assert expected == actual
+
+    assert huff.decode_bytes(huff.encode_bytes(source.encode('utf-8'), adaptive=True)) == source.encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+def test_adaptive_incremental_roundtrip(chunk_size: int):
+    source = 'Ünïcödé 🎉, pretty, pretty princess. ' * 100
+
+    encoder = huff.AdaptiveEncoder()
+    encoded = b''.join(
+        encoder.encode(source[i:i+chunk_size])
+        for i in range(0, len(source), chunk_size)
+    ) + encoder.encode('', final=True)
+    assert encoded == huff.encode(source, adaptive=True)
+
+    decoder = huff.AdaptiveDecoder()
+    decoded = ''.join(
+        decoder.decode(encoded[i:i+chunk_size])
+        for i in range(0, len(encoded), chunk_size)
+    ) + decoder.decode(b'', final=True)
+
+    expected = source
+    actual = decoded
+    assert expected == actual
+
+
+def test_adaptive_decoder_rejects_truncated_data():
+    encoded = huff.encode_bytes(b'Hello, there!', adaptive=True)
+
+    with pytest.raises(ValueError):
+        huff.decode_bytes(encoded[:-1])
+
+    with pytest.raises(ValueError):
+        huff.decode_bytes(encoded + b'\x00')
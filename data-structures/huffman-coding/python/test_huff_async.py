@@ -0,0 +1,101 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import huff
+import huff_async
+
+
+MESSAGES = [
+    'Hello, there!',
+    'I am a pretty, pretty princess. ' * 1000,
+    '',
+]
+
+
+async def _echo_roundtrip(messages, binary: bool, executor=None):
+    async def handle(reader, writer):
+        huff_reader = huff_async.HuffStreamReader(reader, binary=binary, executor=executor)
+        huff_writer = huff_async.HuffStreamWriter(writer, executor=executor)
+        async for message in huff_reader:
+            await huff_writer.write_message(message)
+        huff_writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        reader, writer = await huff_async.open_connection(
+            '127.0.0.1', port, binary=binary, executor=executor)
+
+        for message in messages:
+            await writer.write_message(message)
+        writer.writer.write_eof()
+
+        echoed = [message async for message in reader]
+        writer.close()
+        await writer.wait_closed()
+
+    return echoed
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_async_roundtrip(binary: bool):
+    messages = [m.encode('utf-8') for m in MESSAGES] if binary else MESSAGES
+
+    expected = messages
+    actual = asyncio.run(_echo_roundtrip(messages, binary))
+    assert expected == actual
+
+
+def test_async_roundtrip_with_executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        actual = asyncio.run(_echo_roundtrip(MESSAGES, False, executor))
+
+    expected = MESSAGES
+    assert expected == actual
+
+
+def test_async_messages_are_stream_frames():
+    async def read_messages(data: bytes):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [message async for message in huff_async.HuffStreamReader(reader)]
+
+    stream = io.BytesIO()
+    huff.encode_stream(io.StringIO(MESSAGES[1]), stream, block_size=1000)
+
+    expected = [MESSAGES[1][i:i+1000] for i in range(0, len(MESSAGES[1]), 1000)]
+    actual = asyncio.run(read_messages(stream.getvalue()))
+    assert expected == actual
+
+
+def test_async_reader_rejects_truncated_messages():
+    async def read_message():
+        reader = asyncio.StreamReader()
+        reader.feed_data(huff.FRAME_HEADER.pack(100) + b'\x00' * 10)
+        reader.feed_eof()
+        return [message async for message in huff_async.HuffStreamReader(reader)]
+
+    with pytest.raises(asyncio.IncompleteReadError):
+        asyncio.run(read_message())
+
+
+def test_async_reader_rejects_oversized_messages():
+    async def read_message(data: bytes, **kwargs):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        return await huff_async.HuffStreamReader(reader, **kwargs).read_message()
+
+    block = huff.encode('Hello, there!', canonical=True)
+    frame = huff.FRAME_HEADER.pack(len(block)) + block
+    assert asyncio.run(read_message(frame, max_message_size=len(block))) == 'Hello, there!'
+    with pytest.raises(ValueError):
+        asyncio.run(read_message(frame, max_message_size=len(block) - 1))
+
+    # Only the header of a 4 GiB frame arrives; it's refused without waiting for more
+    with pytest.raises(ValueError):
+        asyncio.run(read_message(huff.FRAME_HEADER.pack(0xffffffff)))
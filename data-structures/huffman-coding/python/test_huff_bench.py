@@ -0,0 +1,169 @@
+"""Throughput and compression benchmarks for the codec, over a fixed corpus
+
+Every benchmark records the header size and compression ratio in its
+extra_info, and checks the encoded size against bench_sizes.json -- sizes
+are deterministic, so any growth fails the run on any machine. Refresh them
+after an intended format change with:
+
+    python -m pytest test_huff_bench.py --update-size-baseline
+
+Timings are gated with pytest-benchmark's own storage. The saved baselines
+under .benchmarks/ are 0001, recorded with:
+
+    python -m pytest test_huff_bench.py --benchmark-save=baseline
+
+and 0002, covering the adaptive mode added since, recorded with:
+
+    python -m pytest test_huff_bench.py -k adaptive --benchmark-save=adaptive
+
+Each mode is compared against the baseline holding it (failing on a >25%
+slowdown), so a full gate is both of:
+
+    python -m pytest test_huff_bench.py -k 'not adaptive' \\
+        --benchmark-compare=0001 --benchmark-compare-fail=mean:25%
+    python -m pytest test_huff_bench.py -k adaptive \\
+        --benchmark-compare=0002 --benchmark-compare-fail=mean:25%
+"""
+import json
+import os
+import random
+from typing import Callable, Dict, NamedTuple
+
+import pytest
+
+import huff
+
+SIZES_PATH = os.path.join(os.path.dirname(__file__), 'bench_sizes.json')
+
+CORPUS_SIZE = 1 << 16
+
+ENGLISH = '''\
+It was the best of times, it was the worst of times.
+The quick brown fox jumps over the lazy dog.
+Call me Ishmael.
+All happy families are alike; each unhappy family is unhappy in its own way.
+In the beginning the Universe was created. This has made a lot of people very angry and been widely regarded as a bad move.
+It is a truth universally acknowledged, that a single man in possession of a good fortune, must be in want of a wife.
+Whether I shall turn out to be the hero of my own life, or whether that station will be held by anybody else, these pages must show.
+The sky above the port was the color of television, tuned to a dead channel.
+'''.splitlines(keepends=True)
+
+
+def _random_bytes() -> bytes:
+    return random.Random(0).randbytes(CORPUS_SIZE)
+
+
+def _english() -> bytes:
+    rng = random.Random(0)
+    text = []
+    length = 0
+    while length < CORPUS_SIZE:
+        line = rng.choice(ENGLISH)
+        text.append(line)
+        length += len(line)
+    return ''.join(text).encode('latin-1')[:CORPUS_SIZE]
+
+
+def _skewed() -> bytes:
+    # Geometric distribution: each byte value half as likely as the last,
+    # which drives code lengths as deep as the alphabet allows.
+    rng = random.Random(0)
+    return bytes(min(int(rng.expovariate(0.693)), 255) for _ in range(CORPUS_SIZE))
+
+
+def _tiny() -> bytes:
+    return b'Hello, there!'
+
+
+CORPORA: Dict[str, Callable[[], bytes]] = {
+    'random': _random_bytes,
+    'english': _english,
+    'skewed': _skewed,
+    'tiny': _tiny,
+}
+
+
+class Mode(NamedTuple):
+    encode: Callable
+    decode: Callable
+    text: bool
+
+
+MODES: Dict[str, Mode] = {
+    'tree': Mode(huff.encode, huff.decode, text=True),
+    'canonical': Mode(lambda s: huff.encode(s, canonical=True), huff.decode, text=True),
+    'bytes': Mode(huff.encode_bytes, huff.decode_bytes, text=False),
+    'adaptive': Mode(lambda b: huff.encode_bytes(b, adaptive=True), huff.decode_bytes, text=False),
+}
+
+
+@pytest.fixture(scope='module')
+def sizes(request):
+    with open(SIZES_PATH) as fp:
+        baseline = json.load(fp)
+
+    update = request.config.getoption('--update-size-baseline')
+    measured = {}
+    yield baseline, measured
+
+    if update:
+        baseline.update(measured)
+        with open(SIZES_PATH, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+
+
+def _prepare(corpus: str, mode: str):
+    if (corpus, mode) == ('random', 'tree'):
+        pytest.skip('The tree header stores its symbol count in one byte, so cannot hold all 256')
+
+    data = CORPORA[corpus]()
+    source = data.decode('latin-1') if MODES[mode].text else data
+    return data, source
+
+
+def _header_size(encoded: bytes) -> int:
+    """Return the bytes preceding the body of canonical-format data"""
+    if encoded[0] != 0:
+        return 2  # The tree header is interleaved with the body; count its fixed part
+    if encoded[1] in (huff.FORMAT_ADAPTIVE, huff.FORMAT_ADAPTIVE_UTF8):
+        return 2  # No code table
+    _, offset = huff.CanonicalCode.unpack(encoded, 2, binary=encoded[1] != huff.FORMAT_CANONICAL)
+    return offset + 1
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('corpus', CORPORA)
+def test_bench_encode(corpus: str, mode: str, benchmark, sizes):
+    data, source = _prepare(corpus, mode)
+    benchmark.group = f'encode-{corpus}'
+
+    encoded = benchmark(MODES[mode].encode, source)
+
+    benchmark.extra_info['input_size'] = len(data)
+    benchmark.extra_info['encoded_size'] = len(encoded)
+    benchmark.extra_info['header_size'] = _header_size(encoded)
+    benchmark.extra_info['ratio'] = len(encoded) / len(data)
+
+    baseline, measured = sizes
+    key = f'{mode}/{corpus}'
+    measured[key] = len(encoded)
+    if key in baseline:
+        assert len(encoded) <= baseline[key], f'{key} grew from {baseline[key]} bytes'
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('corpus', CORPORA)
+def test_bench_decode(corpus: str, mode: str, benchmark):
+    data, source = _prepare(corpus, mode)
+    benchmark.group = f'decode-{corpus}'
+    encoded = MODES[mode].encode(source)
+
+    decoded = benchmark(MODES[mode].decode, encoded)
+
+    benchmark.extra_info['input_size'] = len(data)
+    benchmark.extra_info['throughput_bytes'] = len(data)
+
+    expected = source
+    actual = decoded
+    assert expected == actual
@@ -4,6 +4,8 @@
 #   digit | operator | digit | operator | digit ...
 from __future__ import division
 import argparse
+import operator
+from collections import OrderedDict
 from random import SystemRandom
 random = SystemRandom()
 
@@ -32,6 +34,11 @@ CROSSOVER_RATE = 0.8
 MUTATION_RATE = 0.01
 # Number of chromosomes in a population
 POPULATION_SIZE = 30
+# Number of evaluated expressions remembered
+EXPRESSION_CACHE_SIZE = 4096
+
+TERM_OPERATORS = {'*': operator.mul, '/': operator.truediv}
+SUM_OPERATORS = {'+': operator.add, '-': operator.sub}
 
 
 def split_n_chars(s, n=GENE_BIT_LENGTH):
@@ -77,13 +84,58 @@ def decode_chromosome(chromosome):
     return ''.join(expr)
 
 
+def calculate_expression(expr):
+    """Evaluates an expression of single digits alternating with operators, as
+    produced by decode_chromosome(), left to right: products and quotients
+    are taken as they come, and added to the sum when the term ends."""
+    if len(expr) % 2 == 0:
+        raise SyntaxError('invalid syntax')
+
+    digits = expr[0::2]
+    operators = expr[1::2]
+    if not digits.isdigit() or any(op not in TERM_OPERATORS and
+                                   op not in SUM_OPERATORS
+                                   for op in operators):
+        raise SyntaxError('invalid syntax')
+
+    total = None
+    sum_op = None
+    term = int(digits[0])
+    for op, digit in zip(operators, digits[1:]):
+        if op in TERM_OPERATORS:
+            term = TERM_OPERATORS[op](term, int(digit))
+        else:
+            total = term if sum_op is None else sum_op(total, term)
+            sum_op = SUM_OPERATORS[op]
+            term = int(digit)
+
+    return term if sum_op is None else sum_op(total, term)
+
+
+_expression_cache = OrderedDict()
+
 def evaluate_expression(expr):
-    return eval(expr)
+    """Evaluates a decoded expression, remembering the most recently used
+    ones (and whether they divide by zero)"""
+    try:
+        value = _expression_cache.pop(expr)
+    except KeyError:
+        try:
+            value = calculate_expression(expr)
+        except ZeroDivisionError as e:
+            # Only its args, so no traceback is kept alive
+            value = e.args
+        if len(_expression_cache) >= EXPRESSION_CACHE_SIZE:
+            _expression_cache.popitem(last=False)
+    _expression_cache[expr] = value
+
+    if isinstance(value, tuple):
+        raise ZeroDivisionError(*value)
+    return value
 
 
 def evaluate_chromosome(chromosome):
     """Decodes a chromosome into a mathematical expression and evaluates it."""
-    # eval() is safe because it is limited to the chars defined in GENE_VALUES
     return evaluate_expression(decode_chromosome(chromosome))
 
 
@@ -4,8 +4,12 @@
 
 import argparse
 import math
+import operator
 import os
 import random
+import re
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional, Union
 
 
@@ -20,6 +24,9 @@ DEFAULT_CROSSOVER_RATE = 0.8    # Chance two chromosomes will swap their bits
 DEFAULT_MUTATION_RATE = 0.01    # Chance each bit will be mutated
 DEFAULT_POPULATION_SIZE = 30    # Number of chromosomes in a population
 
+EXPRESSION_CACHE_SIZE = 4096    # Number of evaluated expressions remembered
+DEFAULT_FITNESS_CACHE_SIZE = 100000  # Number of chromosomes' fitness remembered
+
 
 def split_n_chars(s, n):
     """Splits a string at every n chars"""
@@ -43,6 +50,156 @@ def string_to_bits(s):
     return ''.join(f'{c:08b}' for c in s)
 
 
+# Operators as (function, precedence, whether right-associative). Unary
+# operators bind more tightly than anything but ** to their right, so
+# -2**2 == -(2**2), while 2**-1 == 2**(-1)
+UNARY_PRECEDENCE = 3
+BINARY_OPERATORS = {
+    '+': (operator.add, 1, False),
+    '-': (operator.sub, 1, False),
+    '*': (operator.mul, 2, False),
+    '/': (operator.truediv, 2, False),
+    '//': (operator.floordiv, 2, False),
+    '**': (operator.pow, 4, True),
+}
+UNARY_OPERATORS = {
+    '+': (operator.pos, UNARY_PRECEDENCE, True),
+    '-': (operator.neg, UNARY_PRECEDENCE, True),
+}
+
+# Tokens as Python would split them: numbers, '**' and '//' greedily, then
+# single characters
+TOKEN_RE = re.compile(r'[0-9]+|\*\*|//|.', re.DOTALL)
+
+
+def _apply(values, function, precedence):
+    if values is None:
+        return
+    if precedence == UNARY_PRECEDENCE:
+        values[-1] = function(values[-1])
+    else:
+        rhs = values.pop()
+        values[-1] = function(values[-1], rhs)
+
+
+def calculate_expression(expr):
+    """Return the value of an arithmetic expression, in one left-to-right
+    pass over its tokens.
+
+    Operators have the same precedence and associativity as in Python: each
+    waits on a stack until one which binds no more tightly follows it.
+    Raises SyntaxError where eval() would.
+    """
+    try:
+        return _calculate_expression(expr, [])
+    except ArithmeticError:
+        # eval() compiles the whole expression before running any of it, so
+        # a syntax error anywhere comes first
+        _calculate_expression(expr, None)
+        raise
+
+
+def _calculate_expression(expr, values):
+    """Calculate `expr` on the stack `values`, or only check its syntax if
+    that's None"""
+    pending = []  # Operators awaiting their right operand
+    expect_operand = True
+    for token in TOKEN_RE.findall(expr):
+        if expect_operand:
+            if token in UNARY_OPERATORS:
+                pending.append(UNARY_OPERATORS[token])
+                continue
+            if token[0] not in '0123456789':
+                raise SyntaxError('invalid syntax')
+            if token[0] == '0' and token.strip('0'):
+                raise SyntaxError('leading zeros in decimal integer literals '
+                                  'are not permitted')
+            if values is not None:
+                values.append(int(token))
+            expect_operand = False
+            continue
+
+        binary_operator = BINARY_OPERATORS.get(token)
+        if binary_operator is None:
+            raise SyntaxError('invalid syntax')
+        _, precedence, right_assoc = binary_operator
+        while pending and (pending[-1][1] > precedence
+                           or pending[-1][1] == precedence and not right_assoc):
+            _apply(values, *pending.pop()[:2])
+        pending.append(binary_operator)
+        expect_operand = True
+
+    if expect_operand:
+        raise SyntaxError('unexpected EOF while parsing')
+
+    while pending:
+        _apply(values, *pending.pop()[:2])
+    return values and values[0]
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _evaluate_expression(expr):
+    try:
+        return calculate_expression(expr), None
+    except (SyntaxError, ArithmeticError) as e:
+        # Keep only what's needed to raise it again, not the traceback
+        return None, (type(e), e.args)
+
+
+def evaluate_expression(expr):
+    """Return the value of an arithmetic expression of digits and + - * /,
+    as eval() would, remembering the most recently used ones"""
+    value, error = _evaluate_expression(expr)
+    if error is not None:
+        error_type, args = error
+        raise error_type(*args)
+    return value
+
+
+class FitnessCache:
+    """Remembers the decoded expression, value and fitness of chromosomes,
+    up to `maxsize` of them, forgetting the least recently used first."""
+
+    def __init__(self, maxsize=DEFAULT_FITNESS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(maxsize={self.maxsize!r}, '
+                f'size={len(self)}, hits={self.hits}, misses={self.misses})')
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key) -> Optional[dict]:
+        try:
+            attributes = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return attributes
+
+    def put(self, key, attributes: dict):
+        self._entries[key] = attributes
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+
 class Chromosome:
     """Represents a chromosome, i.e. a string of genes."""
 
@@ -90,15 +247,33 @@ class Chromosome:
     # Score multiplier when solution is non-integer (i.e. has a decimal part)
     NON_INTEGER_MULTIPLIER = 0.2
 
-    def __init__(self, gene_string, solution):
+    # Attributes worked out from the gene string, which a FitnessCache keeps
+    CACHED_ATTRIBUTES = ('decoded', 'evaluated', 'is_solution', 'fitness')
+
+    def __init__(self, gene_string, solution, cache: Optional[FitnessCache] = None):
         self.solution = solution
         self.gene_string = gene_string
+        self.cache = cache
         self.genes = split_n_chars(self.gene_string, self.GENE_SIZE)
+
+        cached = cache.get(self.cache_key()) if cache is not None else None
+        if cached is not None:
+            self.__dict__.update(cached)
+            return
+
         self.decoded = self.decode()
         self.evaluated = self.evaluate(self.decoded)
         self.is_solution = self.evaluated == solution
         self.fitness = self.calculate_fitness()
 
+        if cache is not None:
+            cache.put(self.cache_key(), {attr: getattr(self, attr)
+                                         for attr in self.CACHED_ATTRIBUTES})
+
+    def cache_key(self):
+        """Returns what decoding and scoring the chromosome depends on"""
+        return self.__class__, self.solution, self.gene_string
+
     def __repr__(self):
         return f'{self.__class__.__name__}({self.gene_string!r}, {self.solution!r})'
 
@@ -158,7 +333,7 @@ class Chromosome:
             return None
 
         try:
-            return eval(expr)
+            return evaluate_expression(expr)
         except ZeroDivisionError:
             return None
 
@@ -170,14 +345,14 @@ class Chromosome:
             mutated_bits.append(bit)
 
         mutated_gene_string = ''.join(mutated_bits)
-        return self.__class__(mutated_gene_string, self.solution)
+        return self.__class__(mutated_gene_string, self.solution, cache=self.cache)
 
     def __lshift__(self, n: int):
         shifted_gene_string = self.gene_string[n:] + self.gene_string[:n]
-        return self.__class__(shifted_gene_string, self.solution)
+        return self.__class__(shifted_gene_string, self.solution, cache=self.cache)
 
     @classmethod
-    def random(cls, solution, num_genes):
+    def random(cls, solution, num_genes, cache: Optional[FitnessCache] = None):
         bits_in_a_byte = 8
         total_bits_needed = num_genes * cls.GENE_SIZE
         total_bytes_needed = round_up_div(total_bits_needed, bits_in_a_byte)
@@ -186,13 +361,13 @@ class Chromosome:
         bitstring = string_to_bits(random_bits)
         chromosome_bits = bitstring[:total_bits_needed]
 
-        return cls(chromosome_bits, solution)
+        return cls(chromosome_bits, solution, cache=cache)
 
     @classmethod
     def crossover(cls, a, b):
         fulcrum = random.randint(0, len(a)-1)
-        new_x = cls(a[:fulcrum] + b[fulcrum:], a.solution)
-        new_y = cls(b[:fulcrum] + a[fulcrum:], b.solution)
+        new_x = cls(a[:fulcrum] + b[fulcrum:], a.solution, cache=a.cache)
+        new_y = cls(b[:fulcrum] + a[fulcrum:], b.solution, cache=b.cache)
         return new_x, new_y
 
 
@@ -201,9 +376,14 @@ class Simulation:
 
     def __init__(self, solution, population_size=30, chromosome_size=40,
                  crossover_rate=0.8, base_mutation_rate=0.01, max_iterations=1000,
-                 verbosity=VERB_NONE):
+                 verbosity=VERB_NONE, fitness_cache_size=DEFAULT_FITNESS_CACHE_SIZE):
         self.verbosity = verbosity
 
+        # Shared by every chromosome of the simulation, across generations
+        self.fitness_cache = None
+        if fitness_cache_size:
+            self.fitness_cache = FitnessCache(fitness_cache_size)
+
         self.iteration = 1
         self.max_iterations = max_iterations
         self.solution = solution
@@ -217,7 +397,8 @@ class Simulation:
 
     def _generate_random_population(self):
         return [self.chromosome_class.random(self.solution,
-                                             self.chromosome_size)
+                                             self.chromosome_size,
+                                             cache=self.fitness_cache)
                 for _ in range(self.population_size)]
 
     def step(self):
@@ -372,6 +553,11 @@ class Simulation:
             summary = 'No solution found in %d iteration(s)' % iterations
         self._print(summary, VERB_RUN)
 
+        if self.fitness_cache is not None:
+            self._print('Fitness cache: %d hit(s), %d miss(es), %.1f%% hit rate' % (
+                self.fitness_cache.hits, self.fitness_cache.misses,
+                self.fitness_cache.hit_rate * 100), VERB_INFO)
+
     def _print(self, msg, level):
         if self.verbosity >= level:
             print(msg)
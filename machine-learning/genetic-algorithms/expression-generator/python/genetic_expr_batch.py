@@ -0,0 +1,407 @@
+#!/usr/bin/python
+# Evaluates whole populations of genetic_expr2 chromosomes at once, holding
+# them as a matrix of gene codes rather than one Chromosome object apiece.
+
+import math
+
+import numpy as np
+
+from genetic_expr2 import (
+    Chromosome,
+    DEFAULT_CHROMOSOME_SIZE,
+    DEFAULT_CROSSOVER_RATE,
+    DEFAULT_MUTATION_RATE,
+    DEFAULT_POPULATION_SIZE,
+)
+
+
+# Symbols of decoded genes: digits are their own values, operators follow
+SYMBOLS = '0123456789+-*/'
+PLUS, MINUS, STAR, SLASH = range(10, 14)
+PAD = 255  # Unknown genes, and the end of a decoded expression
+
+# Binary operators of an expression, as parsed by Python
+OP_NONE, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_POW, OP_FLOORDIV = range(7)
+SYMBOL_OPS = np.zeros(256, dtype=np.int8)
+SYMBOL_OPS[[PLUS, MINUS, STAR, SLASH]] = OP_ADD, OP_SUB, OP_MUL, OP_DIV
+
+
+class Population:
+    """A population of chromosomes, as a uint8 matrix with a row of gene codes
+    per chromosome.
+
+    Decoding, evaluation and fitness follow chromosome_class (a
+    genetic_expr2.Chromosome), but are computed for every row at once.
+    Expressions are evaluated as eval() would, but in float64: ones eval()
+    would reject (e.g. '*3' or '07'), or which divide by zero, evaluate to
+    NaN where Chromosome would have None. Chromosome evaluates integers
+    exactly, though, with no limit on their size -- so here, integers past
+    2**53 are rounded, and any value (even an intermediate one) past the
+    float64 range makes the whole expression NaN. '9**999*0+1' is 1 to
+    Chromosome, for instance, but NaN here.
+    """
+
+    chromosome_class = Chromosome
+
+    def __init__(self, genes, solution):
+        self.genes = np.asarray(genes, dtype=np.uint8)
+        self.solution = solution
+        self.symbols, self.lengths = self.decode()
+        self.evaluated = self.evaluate()
+        self.is_solution = self.evaluated == solution
+        self.fitness = self.calculate_fitness()
+
+    def __len__(self):
+        return len(self.genes)
+
+    @classmethod
+    def _symbol_table(cls):
+        """Return an array mapping each gene code to its symbol"""
+        table = np.full(1 << cls.chromosome_class.GENE_SIZE, PAD, dtype=np.uint8)
+        for bits, value in cls.chromosome_class.GENE_VALUE_BITS.items():
+            table[int(bits, 2)] = SYMBOLS.index(value)
+        return table
+
+    @classmethod
+    def random(cls, solution, size, num_genes, rng=None):
+        rng = np.random.default_rng(rng)
+        codes = 1 << cls.chromosome_class.GENE_SIZE
+        return cls(rng.integers(0, codes, (size, num_genes), dtype=np.uint8),
+                   solution)
+
+    @classmethod
+    def from_gene_strings(cls, gene_strings, solution):
+        bits = np.array([[c == '1' for c in s] for s in gene_strings],
+                        dtype=np.uint8)
+        return cls(cls._pack_bits(bits), solution)
+
+    @classmethod
+    def from_chromosomes(cls, chromosomes):
+        chromosomes = list(chromosomes)
+        return cls.from_gene_strings([c.gene_string for c in chromosomes],
+                                     chromosomes[0].solution)
+
+    def gene_string(self, i):
+        return ''.join(map(str, self._bits()[i]))
+
+    def decoded(self, i):
+        return ''.join(SYMBOLS[s] for s in self.symbols[i, :self.lengths[i]])
+
+    def chromosome(self, i):
+        """Return row `i` as a chromosome_class instance (which evaluates it
+        again)"""
+        return self.chromosome_class(self.gene_string(i), self.solution)
+
+    @classmethod
+    def _pack_bits(cls, bits):
+        """Return the gene codes of a matrix of bits, GENE_SIZE per gene"""
+        gene_size = cls.chromosome_class.GENE_SIZE
+        weights = 1 << np.arange(gene_size - 1, -1, -1)
+        genes = bits.reshape(len(bits), -1, gene_size) @ weights
+        return genes.astype(np.uint8)
+
+    def _bits(self):
+        """Return the bits of each chromosome, as a row of 0s and 1s"""
+        gene_size = self.chromosome_class.GENE_SIZE
+        shifts = np.arange(gene_size - 1, -1, -1, dtype=np.uint8)
+        bits = (self.genes[:, :, None] >> shifts) & 1
+        return bits.reshape(len(self.genes), -1)
+
+    def decode(self):
+        """Return the symbols of each decoded expression, padded with PAD, and
+        their lengths.
+
+        As in Chromosome.decode(), unknown genes are dropped, as are any
+        operators after the last digit.
+        """
+        genes = self._symbol_table()[self.genes]
+        known = genes != PAD
+
+        # Move the known genes of each row to its start, in order
+        symbols = np.full_like(genes, PAD)
+        columns = np.cumsum(known, axis=1) - 1
+        rows = np.broadcast_to(np.arange(len(genes))[:, None], genes.shape)
+        symbols[rows[known], columns[known]] = genes[known]
+
+        is_digit = symbols < 10
+        width = symbols.shape[1]
+        last_digit = width - 1 - np.argmax(is_digit[:, ::-1], axis=1)
+        lengths = np.where(is_digit.any(axis=1), last_digit + 1, 0)
+        symbols[np.arange(width) >= lengths[:, None]] = PAD
+        return symbols, lengths
+
+    def _parse(self):
+        """Tokenize every expression the way Python would.
+
+        Returns matrices with a row per symbol position (and a column per
+        expression): whether a number ends there, and if so its value, the
+        binary operator before it and the sign from any unary operators on
+        it. Also returns whether each expression is a syntax error.
+        """
+        # Work a position at a time, over contiguous rows
+        symbols = np.ascontiguousarray(self.symbols.T)
+        width, size = symbols.shape
+        is_digit = symbols < 10
+        is_op = (symbols >= 10) & (symbols != PAD)
+        ends = is_digit & ~np.pad(is_digit[1:], ((0, 1), (0, 0)))
+
+        numbers = np.zeros((width, size))
+        binops = np.zeros((width, size), dtype=np.int8)
+        signs = np.ones((width, size))
+        error = np.zeros(size, dtype=bool)
+
+        number = np.zeros(size)
+        in_number = np.zeros(size, dtype=bool)
+        seen_number = np.zeros(size, dtype=bool)
+        leading_zero = np.zeros(size, dtype=bool)
+        binop = np.zeros(size, dtype=np.int8)
+        sign = np.ones(size)
+        number_binop = binop.copy()
+        number_sign = sign.copy()
+        tokens = np.zeros(size, dtype=np.intp)
+        # Whether the last symbol was a '*' or '/' token which another could
+        # make a '**' or '//'
+        open_token = np.zeros(size, dtype=bool)
+
+        for j in range(width):
+            c = symbols[j]
+            digit = is_digit[j]
+            op = is_op[j]
+
+            # Numbers: a digit after a leading zero is an error, unless
+            # it's another zero
+            started = digit & ~in_number
+            error |= digit & in_number & leading_zero & (c != 0)
+            leading_zero = np.where(started, c == 0, leading_zero)
+            number = np.where(started, c, np.where(digit, number * 10 + c, number))
+            number_binop = np.where(started, binop, number_binop)
+            number_sign = np.where(started, sign, number_sign)
+            numbers[j] = number
+            binops[j] = number_binop
+            signs[j] = number_sign
+
+            # Each run of operators is a binary operator then unary signs,
+            # or only signs before the first number. Tokens are split
+            # greedily, so a '*' or '/' directly after the same one makes a
+            # '**' or '//'
+            seen_number |= in_number
+            tokens = np.where(in_number, 0, tokens)
+            merged = op & open_token & (c == symbols[j - 1])
+            new = op & ~merged
+            binary = new & (tokens == 0) & seen_number
+            unary = new & ~binary
+            error |= unary & (c >= STAR)
+            sign = np.where(started, 1.0,
+                            np.where(unary & (c == MINUS), -sign, sign))
+            binop = np.where(binary, SYMBOL_OPS[c], binop)
+            doubled = merged & (tokens == 1) & seen_number
+            binop = np.where(doubled & (c == STAR), OP_POW, binop)
+            binop = np.where(doubled & (c == SLASH), OP_FLOORDIV, binop)
+            tokens += new
+            open_token = new & (c >= STAR)
+            in_number = digit
+
+        return ends, numbers, binops, signs, error
+
+    def evaluate(self):
+        """Return the value of each decoded expression, or NaN"""
+        ends, numbers, binops, signs, error = self._parse()
+        width, size = ends.shape
+
+        with np.errstate(all='ignore'):
+            # Powers first, right to left: each number's value is its sign
+            # times it raised to the value of the next, if '**' links them
+            factors = np.zeros((width, size))
+            value = np.zeros(size)
+            raised = np.zeros(size, dtype=bool)
+            for j in range(width - 1, -1, -1):
+                end = ends[j]
+                base = numbers[j]
+                error |= end & raised & (base == 0) & (value < 0)
+                power = end & raised
+                factor = np.power(base, value, out=base.copy(), where=power)
+                factor *= signs[j]
+                value = np.where(end, factor, value)
+                raised = np.where(end, binops[j] == OP_POW, raised)
+                factors[j] = value
+
+            # Then terms and sums, left to right over the numbers not
+            # raising another
+            total = np.zeros(size)
+            have_total = np.zeros(size, dtype=bool)
+            term = np.zeros(size)
+            term_sign = np.ones(size)
+            have_term = np.zeros(size, dtype=bool)
+            for j in range(width):
+                op = binops[j]
+                factor = factors[j]
+                end = ends[j] & (op != OP_POW)
+
+                new_term = end & ((op == OP_NONE) | (op == OP_ADD) | (op == OP_SUB))
+                ended = new_term & have_term
+                total = np.where(ended & have_total, total + term_sign * term,
+                                 np.where(ended, term, total))
+                have_total |= ended
+                have_term |= new_term
+                term = np.where(new_term, factor, term)
+                term_sign = np.where(new_term & (op == OP_SUB), -1.0,
+                                     np.where(new_term, 1.0, term_sign))
+
+                error |= end & ((op == OP_DIV) | (op == OP_FLOORDIV)) & (factor == 0)
+                term = np.where(end & (op == OP_MUL), term * factor, term)
+                term = np.where(end & (op == OP_DIV), term / factor, term)
+                term = np.where(end & (op == OP_FLOORDIV),
+                                np.floor_divide(term, factor), term)
+
+            total = np.where(have_total, total + term_sign * term, term)
+
+        invalid = error | ~have_term | ~np.isfinite(total)
+        return np.where(invalid, np.nan, total)
+
+    def calculate_fitness(self):
+        cls = self.chromosome_class
+        evaluated = self.evaluated
+
+        with np.errstate(all='ignore'):
+            is_integer = evaluated == np.floor(evaluated)
+            int_bias = np.where(is_integer, 1, cls.NON_INTEGER_MULTIPLIER)
+            distance = np.trunc(np.abs(self.solution - evaluated))
+            fitness = cls.IMPERFECT_MAX_SCORE * 1.0 / distance * int_bias
+
+        fitness = np.where(distance == 0, 0.0, fitness)
+        fitness = np.where(is_integer & self.is_solution, 1.0, fitness)
+        return np.where(np.isnan(evaluated), 0.0, fitness)
+
+
+class BatchSimulation:
+    """Runs genetic_expr2.Simulation's generations over a Population, choosing
+    parents, crossing them over, mutating and shifting them for every pair
+    of children at once."""
+
+    population_class = Population
+
+    def __init__(self, solution, population_size=DEFAULT_POPULATION_SIZE,
+                 chromosome_size=DEFAULT_CHROMOSOME_SIZE,
+                 crossover_rate=DEFAULT_CROSSOVER_RATE,
+                 base_mutation_rate=DEFAULT_MUTATION_RATE, max_iterations=1000,
+                 rng=None):
+        self.rng = np.random.default_rng(rng)
+
+        self.iteration = 1
+        self.max_iterations = max_iterations
+        self.solution = solution
+
+        self.chromosome_size = chromosome_size
+        self.population_size = population_size
+        self.crossover_rate = crossover_rate
+        self.base_mutation_rate = base_mutation_rate
+
+        self.population = self.population_class.random(
+            solution, population_size, chromosome_size, self.rng)
+
+    def step(self):
+        self.population = self._new_children()
+        return self.check_for_solution()
+
+    def _roulette_wheel(self, n, exclude=None):
+        """Return the indices of `n` chromosomes, random with respect to
+        fitness
+
+        If given, exclude[i] is never the i'th index, as Simulation never
+        picks one chromosome as both parents.
+        """
+        rng = self.rng
+        fitness = np.abs(self.population.fitness)
+        weights = np.cumsum(fitness)
+        size = len(weights)
+        if size < 2:
+            exclude = None
+
+        # Spin a wheel with the excluded chromosome's stretch cut out
+        excluded = 0.0 if exclude is None else fitness[exclude]
+        totals = (weights[-1] if size else 0.0) - excluded
+        picks = rng.uniform(0, 1, n) * totals
+        if exclude is not None:
+            picks = np.where(picks >= weights[exclude] - excluded,
+                             picks + excluded, picks)
+        indices = np.minimum(np.searchsorted(weights, picks, side='right'),
+                             size - 1)
+
+        # With no fitness to go on (or a rounding error landing on the
+        # excluded stretch), choose uniformly instead
+        uniform = totals <= 0
+        if exclude is not None:
+            uniform |= indices == exclude
+        if uniform.any():
+            if exclude is None:
+                others = rng.integers(0, size, n)
+            else:
+                others = rng.integers(0, size - 1, n)
+                others += others >= exclude
+            indices = np.where(uniform, others, indices)
+        return indices
+
+    def _new_children(self):
+        rng = self.rng
+        population = self.population
+        pairs = (self.population_size + 1) // 2
+        gene_size = population.chromosome_class.GENE_SIZE
+
+        bits = population._bits()
+        parents_a = self._roulette_wheel(pairs)
+        parents_b = self._roulette_wheel(pairs, exclude=parents_a)
+        a, b = bits[parents_a], bits[parents_b]
+        num_bits = bits.shape[1]
+
+        generation_multiplier = 2 - math.log(self.iteration % 100 + 1, 100)
+        shift_multiplier = generation_multiplier
+
+        # See if we should crossover, swapping bits past the fulcrum
+        crossed = rng.random(pairs) <= self.crossover_rate
+        fulcrums = rng.integers(0, num_bits, pairs)
+        swap = crossed[:, None] & (np.arange(num_bits) >= fulcrums[:, None])
+        children = np.concatenate([np.where(swap, b, a), np.where(swap, a, b)])
+
+        # Children which weren't crossed over are their parents, whose fitness
+        # is known; only the rest need evaluating
+        crossed_fitness = population.fitness[np.concatenate([parents_a, parents_b])]
+        changed = np.concatenate([crossed, crossed])
+        if changed.any():
+            crossed_fitness[changed] = self.population_class(
+                self.population_class._pack_bits(children[changed]),
+                self.solution).fitness
+
+        mutation_rate = (self.base_mutation_rate * generation_multiplier
+                         - rng.random(pairs) * self.base_mutation_rate * generation_multiplier)
+        mutation_rate = np.concatenate([mutation_rate, mutation_rate])
+        mutation_rate = mutation_rate * (1 - np.abs(crossed_fitness)
+                                         + rng.random(2 * pairs) * generation_multiplier)
+
+        flips = rng.random(children.shape) < mutation_rate[:, None]
+        children ^= flips.astype(children.dtype)
+
+        shifted = rng.random(2 * pairs) < mutation_rate
+        shift = int(gene_size * shift_multiplier)
+        children[shifted] = np.roll(children[shifted], -shift, axis=1)
+
+        return self.population_class(
+            self.population_class._pack_bits(children), self.solution)
+
+    def check_for_solution(self):
+        """Return the index of a chromosome which is a solution, or None"""
+        solutions = np.flatnonzero(self.population.is_solution)
+        if len(solutions):
+            return int(solutions[0])
+
+    def run(self, max_iterations=None):
+        """Return the number of iterations run and the solution's index, or
+        None if none was found"""
+        if max_iterations is None:
+            max_iterations = self.max_iterations
+
+        for iteration in range(max_iterations):
+            self.iteration = iteration
+            solution_index = self.step()
+            if solution_index is not None:
+                return iteration, solution_index
+        return max_iterations, None
@@ -11,7 +11,7 @@ from tkinter import font
 from tkinter.simpledialog import askinteger
 from typing import List, Optional
 
-from genetic_expr2 import Simulation, Chromosome
+from genetic_expr2 import Simulation, Chromosome, FitnessCache
 
 
 MAX_DIGITS = 3
@@ -95,14 +95,17 @@ class UIChromosome(Chromosome):
         if value is not None
     }
 
+    CACHED_ATTRIBUTES = Chromosome.CACHED_ATTRIBUTES + ('gene_colors',)
+
     def __init__(self, gene_string, solution, *,
                  decode_max_digits: int = MAX_DIGITS,
-                 decode_allow_standalone_zeroes: bool = ALLOW_STANDALONE_ZEROES):
+                 decode_allow_standalone_zeroes: bool = ALLOW_STANDALONE_ZEROES,
+                 cache: Optional[FitnessCache] = None):
         self.decode_max_digits = decode_max_digits
         self.decode_allow_standalone_zeroes = decode_allow_standalone_zeroes
 
         self.gene_colors = []
-        super(UIChromosome, self).__init__(gene_string, solution)
+        super(UIChromosome, self).__init__(gene_string, solution, cache=cache)
 
         self.evaluated_str = '?'
         if self.evaluated:
@@ -112,6 +115,10 @@ class UIChromosome(Chromosome):
         if self.decoded:
             self.decoded_str = self.decoded.replace('*', '×').replace('/', '÷')
 
+    def cache_key(self):
+        return super().cache_key() + (self.decode_max_digits,
+                                      self.decode_allow_standalone_zeroes)
+
     def decode_gene(self, gene_value, *, pretty: bool = False):
         decoded = super().decode_gene(gene_value)
 
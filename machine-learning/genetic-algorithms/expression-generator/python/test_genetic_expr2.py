@@ -0,0 +1,119 @@
+import pytest
+
+from genetic_expr2 import (
+    Chromosome,
+    FitnessCache,
+    _evaluate_expression,
+    evaluate_expression,
+)
+
+GENES = {expr: bits for bits, expr in Chromosome.GENE_VALUE_BITS.items()}
+
+
+def encode_gene_expression(gene_expression: str) -> str:
+    return ''.join(GENES[c] for c in gene_expression)
+
+
+@pytest.mark.parametrize('expr', [
+    '7',
+    '12+34',
+    '1+2*3-4/8',
+    '10-3-2',
+    '9/4/2',
+    '2*3**2',
+    '2**3**2',
+    '-2**2',
+    '2**-1',
+    '2**-2**2',
+    '-7//2',
+    '7//-2*3',
+    '1--2',
+    '1-+-2',
+    '5*-6+1',
+    '00',
+])
+def test_evaluate_like_eval(expr: str):
+    expected = eval(expr)
+    actual = evaluate_expression(expr)
+    assert (actual, type(actual)) == (expected, type(expected))
+
+
+@pytest.mark.parametrize('expr', [
+    '',
+    '+',
+    '*3',
+    '07',
+    '2***3',
+    '2*/3',
+    '1+',
+    # A syntax error comes first, even after a division by zero
+    '1/0+',
+])
+def test_evaluate_syntax_error(expr: str):
+    with pytest.raises(SyntaxError):
+        evaluate_expression(expr)
+
+
+def test_evaluate_zero_division():
+    for _ in range(2):
+        with pytest.raises(ZeroDivisionError):
+            evaluate_expression('1+2/0')
+
+
+def test_evaluate_raises_a_fresh_error_each_time():
+    errors = []
+    for _ in range(2):
+        with pytest.raises(ZeroDivisionError) as excinfo:
+            evaluate_expression('4/0')
+        errors.append(excinfo.value)
+
+    assert errors[0] is not errors[1]
+    # The cache holds no exception, so no traceback is kept alive
+    _, cached = _evaluate_expression('4/0')
+    assert not isinstance(cached, BaseException)
+
+
+def test_evaluate_remembers_expressions():
+    expr = '6*7+1-8'
+    evaluate_expression(expr)
+    hits = _evaluate_expression.cache_info().hits
+    assert evaluate_expression(expr) == 35
+    assert _evaluate_expression.cache_info().hits == hits + 1
+
+
+def test_chromosome_zero_division_is_none():
+    chromosome = Chromosome(encode_gene_expression('3/0'), 3)
+    assert chromosome.evaluated is None
+    assert chromosome.fitness == 0.0
+
+
+def test_fitness_cache_evicts_least_recently_used():
+    cache = FitnessCache(maxsize=2)
+    cache.put('a', {'fitness': 0.1})
+    cache.put('b', {'fitness': 0.2})
+    assert cache.get('a') == {'fitness': 0.1}
+    cache.put('c', {'fitness': 0.3})
+
+    assert cache.get('b') is None
+    assert cache.get('c') == {'fitness': 0.3}
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.hit_rate == pytest.approx(2 / 3)
+
+
+def test_chromosome_uses_fitness_cache():
+    cache = FitnessCache()
+    gene_string = encode_gene_expression('6*7+1')
+    first = Chromosome(gene_string, 43, cache=cache)
+    second = Chromosome(gene_string, 43, cache=cache)
+    other_solution = Chromosome(gene_string, 42, cache=cache)
+
+    assert (cache.hits, cache.misses) == (1, 2)
+    for attr in Chromosome.CACHED_ATTRIBUTES:
+        assert getattr(second, attr) == getattr(first, attr)
+    assert second.is_solution and not other_solution.is_solution
+
+    # Children share their parents' cache
+    assert (first << 0).cache is cache
+    assert cache.hits == 2
+
@@ -0,0 +1,184 @@
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from genetic_expr2 import Chromosome
+from genetic_expr_batch import BatchSimulation, Population
+
+EXPR_GENES = {
+    expr: bits
+    for bits, expr in Chromosome.GENE_VALUE_BITS.items()
+}
+EXPR_GENES['?'] = '1111'
+
+
+def encode_gene_expression(gene_expression: str) -> str:
+    return ''.join(EXPR_GENES[c] for c in gene_expression)
+
+
+def population_of(*gene_expressions: str, solution=100) -> Population:
+    width = max(map(len, gene_expressions))
+    return Population.from_gene_strings(
+        [encode_gene_expression(expr.ljust(width, '?'))
+         for expr in gene_expressions],
+        solution)
+
+
+@pytest.mark.parametrize('gene_expression,decoded', [
+    ('1', '1'),
+    ('1+', '1'),
+    ('1+2*/', '1+2'),
+    ('?1?+?2?', '1+2'),
+    ('+-', ''),
+    ('??', ''),
+])
+def test_decode(gene_expression: str, decoded: str):
+    population = population_of(gene_expression)
+    assert population.decoded(0) == decoded
+
+
+@pytest.mark.parametrize('expr', [
+    '7',
+    '12+34',
+    '1+2*3-4/8',
+    '2*3**2',
+    '2**3**2',
+    '-2**2',
+    '2**-1',
+    '2**-2**2',
+    '7//2',
+    '-7//2',
+    '7//-2*3',
+    '1--2',
+    '1-+-2',
+    '-+5',
+    '5*-6+1',
+    '9/4/2',
+    '00',
+    '0+00*3',
+    '10-3-2',
+])
+def test_evaluate_like_eval(expr: str):
+    population = population_of(expr)
+    assert population.evaluated[0] == eval(expr)
+
+
+@pytest.mark.parametrize('expr', [
+    '*3',
+    '/3',
+    '07',
+    '1+007',
+    '2***3',
+    '2///3',
+    '2*/3',
+    '2+*3',
+    '1/0',
+    '1//0',
+    '0**-1',
+    '5+3/0*2',
+    '',
+])
+def test_evaluate_invalid(expr: str):
+    population = population_of(expr or '?')
+    assert math.isnan(population.evaluated[0])
+    assert population.fitness[0] == 0.0
+
+
+def test_evaluate_in_float64_unlike_chromosome():
+    # Chromosome works in exact integers, which can grow past float64
+    expr = '9**999*0+1'
+    chromosome = Chromosome(encode_gene_expression(expr), 1)
+    assert chromosome.evaluated == 1
+    assert chromosome.is_solution
+
+    population = population_of(expr, '2**60+1', solution=1)
+    assert math.isnan(population.evaluated[0])
+    assert not population.is_solution[0]
+    assert population.fitness[0] == 0.0
+
+    # and ints past 2**53 are rounded
+    assert population.evaluated[1] == float(2**60 + 1) != 2**60 + 1
+
+
+def test_fitness_like_chromosome():
+    rng = random.Random(0)
+    genes = list(Chromosome.GENES)
+    gene_strings = []
+    while len(gene_strings) < 500:
+        gene_string = ''.join(rng.choice(genes) for _ in range(12))
+        chromosome_genes = [gene_string[i:i + 4] for i in range(0, 48, 4)]
+        expr = ''.join(Chromosome.GENE_VALUE_BITS.get(g, '') for g in chromosome_genes)
+        # Huge powers would take eval() too long
+        if '**' not in expr:
+            gene_strings.append(gene_string)
+
+    population = Population.from_gene_strings(gene_strings, 100)
+    for i, gene_string in enumerate(gene_strings):
+        try:
+            chromosome = Chromosome(gene_string, 100)
+        except (SyntaxError, OverflowError):
+            assert math.isnan(population.evaluated[i])
+            continue
+
+        assert population.decoded(i) == chromosome.decoded
+        if chromosome.evaluated is None:
+            assert math.isnan(population.evaluated[i])
+        else:
+            assert population.evaluated[i] == chromosome.evaluated
+        assert population.fitness[i] == chromosome.fitness
+        assert population.is_solution[i] == chromosome.is_solution
+
+
+def test_gene_strings_round_trip():
+    gene_strings = [encode_gene_expression('1+2*3'),
+                    encode_gene_expression('?9-4/')]
+    population = Population.from_gene_strings(gene_strings, 7)
+    assert [population.gene_string(i) for i in range(2)] == gene_strings
+    assert population.chromosome(0) == Chromosome(gene_strings[0], 7)
+    assert population.is_solution.tolist() == [True, False]
+
+
+@pytest.mark.parametrize('gene_expressions', [
+    ('7', '1', '2', '3'),
+    ('*', '/', '+', '-'),
+])
+def test_roulette_wheel_never_picks_both_parents_alike(gene_expressions):
+    simulation = BatchSimulation(7, population_size=4, rng=0)
+    simulation.population = population_of(*gene_expressions, solution=7)
+
+    parents_a = simulation._roulette_wheel(1000)
+    parents_b = simulation._roulette_wheel(1000, exclude=parents_a)
+    assert (parents_a != parents_b).all()
+    assert set(parents_b.tolist()) == {0, 1, 2, 3}
+
+
+@pytest.mark.parametrize('crossover_rate,evaluated_sizes', [
+    (0.0, [10]),
+    (1.0, [10, 10]),
+])
+def test_new_children_evaluates_only_crossed_children(
+        crossover_rate, evaluated_sizes, monkeypatch):
+    simulation = BatchSimulation(7, population_size=10,
+                                 crossover_rate=crossover_rate, rng=0)
+
+    sizes = []
+    original_init = Population.__init__
+
+    def recording_init(self, genes, solution):
+        sizes.append(len(genes))
+        original_init(self, genes, solution)
+
+    monkeypatch.setattr(Population, '__init__', recording_init)
+    simulation._new_children()
+    assert sizes == evaluated_sizes
+
+
+def test_simulation_finds_solution():
+    simulation = BatchSimulation(184, population_size=500, rng=0)
+    iterations, index = simulation.run(200)
+    assert index is not None
+    assert simulation.population.evaluated[index] == 184
+    assert simulation.population.chromosome(index).is_solution
@@ -1,6 +1,7 @@
 import pytest
 
-from genetic_expr_ui import UIChromosome
+from genetic_expr2 import FitnessCache
+from genetic_expr_ui import UIChromosome, UISimulation
 
 EXPR_GENES = {
     expr: bits
@@ -63,3 +64,28 @@ def test_decode(gene_expression: str, colors: str, decoded: str):
     expected = (decoded, expected_colors)
     actual = (chromosome.decoded, chromosome.gene_colors)
     assert expected == actual
+
+
+def test_gene_colors_cached():
+    cache = FitnessCache()
+    gene_string = encode_gene_expression('?1+2-')
+    first = UIChromosome(gene_string, 123, cache=cache)
+    second = UIChromosome(gene_string, 123, cache=cache)
+
+    assert cache.hits == 1
+    assert second.gene_colors == first.gene_colors
+    assert second.decoded_str == first.decoded_str
+
+    # Decoding options are part of the key
+    UIChromosome(gene_string, 123, decode_max_digits=1, cache=cache)
+    assert cache.misses == 2
+
+
+def test_simulation_shares_fitness_cache():
+    simulation = UISimulation(42, population_size=10, chromosome_size=10)
+    assert all(c.cache is simulation.fitness_cache for c in simulation.population)
+    simulation.step()
+    assert all(c.cache is simulation.fitness_cache for c in simulation.population)
+    assert simulation.fitness_cache.misses > 0
+
+    assert UISimulation(42, fitness_cache_size=0).fitness_cache is None
@@ -1,7 +1,7 @@
-#!/bin/env python
+#!/bin/env python3
 from smxreader import SourcePawnPlugin
 
 if __name__ == '__main__':
     import sys
     plugin = SourcePawnPlugin(open(' '.join(sys.argv[1:]), 'rb'))
-    print plugin
+    print(plugin)
@@ -0,0 +1,91 @@
+"""A persistent index of plug-in summaries, keyed on each file's path, size
+and modification time
+
+A plug-in whose file hasn't changed since it was last described costs a
+single stat() to look up, rather than a decompress and parse.
+"""
+import json
+import os
+import sqlite3
+
+from scan import describe_plugin
+
+# Bumped whenever describe_plugin() records gain or change fields (or which
+# are stored changes), so that summaries stored by an older version are
+# thrown away rather than reused
+RECORD_VERSION = 3
+
+
+class PluginCache(object):
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        version, = self.db.execute('PRAGMA user_version').fetchone()
+        if version != RECORD_VERSION:
+            self.db.execute('DROP TABLE IF EXISTS plugins')
+            self.db.execute('PRAGMA user_version = %d' % RECORD_VERSION)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS plugins (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                record TEXT NOT NULL
+            )
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, path, st=None):
+        """Return the JSON summary stored for `path`, or None if there's none
+        for the file as it stands (as given by `st`, else by stat()ing it)
+
+        Summaries are keyed on the absolute path, so the one returned gives
+        `path` as passed in, not as it was spelled when it was stored.
+        """
+        if st is None:
+            st = os.stat(path)
+
+        row = self.db.execute(
+            'SELECT record FROM plugins WHERE path = ? AND size = ? AND mtime = ?',
+            (os.path.abspath(path), st.st_size, st.st_mtime)).fetchone()
+        if row is None:
+            return None
+
+        record = json.loads(row[0])
+        record['path'] = path
+        return json.dumps(record, sort_keys=True)
+
+    def store(self, path, st, record):
+        """Store the JSON summary `record` for `path`, as it was when `st` was
+        taken"""
+        self.db.execute(
+            'INSERT OR REPLACE INTO plugins (path, size, mtime, record) '
+            'VALUES (?, ?, ?, ?)',
+            (os.path.abspath(path), st.st_size, st.st_mtime, record))
+
+    def describe(self, path):
+        """Return the summary of the plug-in at `path`, parsing it only if it
+        has changed
+
+        Failures aren't stored, so the plug-in is parsed again next time.
+        """
+        st = os.stat(path)
+        record = self.lookup(path, st)
+        if record is not None:
+            return json.loads(record)
+
+        record = describe_plugin(path)
+        if 'error' not in record:
+            self.store(path, st, json.dumps(record, sort_keys=True))
+            self.commit()
+        return record
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from smxbuilder import build_smx
+
+
+@pytest.fixture
+def make_smx(tmp_path):
+    """Return a function writing build_smx(**kwargs) (or else `contents`),
+    cut off after `truncate` bytes if given, to a file, and returning its
+    path"""
+    def make(filename='plugin.smx', contents=None, truncate=None, **kwargs):
+        if contents is None:
+            contents = build_smx(**kwargs)
+        path = tmp_path / filename
+        path.write_bytes(contents[:truncate])
+        return str(path)
+    return make
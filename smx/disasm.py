@@ -0,0 +1,340 @@
+#!/bin/env python3
+"""Disassemble the p-code of a SourcePawn plug-in
+
+Instructions are decoded from a table of opcodes into parallel arrays --
+the offset, opcode and operands of each one are indices into the code cells,
+not objects -- along with an index of the natives and functions each call
+site refers to.
+
+    python disasm.py plugin.smx             # listing
+    python disasm.py --xrefs plugin.smx     # callee -> calling functions
+"""
+import argparse
+import sys
+from array import array
+
+from smxreader import SourcePawnPlugin, SourcePawnPluginFormatError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CELL_SIZE = 4
+
+# (mnemonic, number of operand cells), indexed by opcode. CASETBL's length
+# depends on its first operand; see _operand_count().
+OPCODES = [
+    ('none', 0), ('load.pri', 1), ('load.alt', 1), ('load.s.pri', 1),
+    ('load.s.alt', 1), ('lref.pri', 1), ('lref.alt', 1), ('lref.s.pri', 1),
+    ('lref.s.alt', 1), ('load.i', 0), ('lodb.i', 1), ('const.pri', 1),
+    ('const.alt', 1), ('addr.pri', 1), ('addr.alt', 1), ('stor.pri', 1),
+    ('stor.alt', 1), ('stor.s.pri', 1), ('stor.s.alt', 1), ('sref.pri', 1),
+    ('sref.alt', 1), ('sref.s.pri', 1), ('sref.s.alt', 1), ('stor.i', 0),
+    ('strb.i', 1), ('lidx', 0), ('lidx.b', 1), ('idxaddr', 0),
+    ('idxaddr.b', 1), ('align.pri', 1), ('align.alt', 1), ('lctrl', 1),
+    ('sctrl', 1), ('move.pri', 0), ('move.alt', 0), ('xchg', 0),
+    ('push.pri', 0), ('push.alt', 0), ('push.r', 1), ('push.c', 1),
+    ('push', 1), ('push.s', 1), ('pop.pri', 0), ('pop.alt', 0),
+    ('stack', 1), ('heap', 1), ('proc', 0), ('ret', 0),
+    ('retn', 0), ('call', 1), ('call.pri', 0), ('jump', 1),
+    ('jrel', 1), ('jzer', 1), ('jnz', 1), ('jeq', 1),
+    ('jneq', 1), ('jless', 1), ('jleq', 1), ('jgrtr', 1),
+    ('jgeq', 1), ('jsless', 1), ('jsleq', 1), ('jsgrtr', 1),
+    ('jsgeq', 1), ('shl', 0), ('shr', 0), ('sshr', 0),
+    ('shl.c.pri', 1), ('shl.c.alt', 1), ('shr.c.pri', 1), ('shr.c.alt', 1),
+    ('smul', 0), ('sdiv', 0), ('sdiv.alt', 0), ('umul', 0),
+    ('udiv', 0), ('udiv.alt', 0), ('add', 0), ('sub', 0),
+    ('sub.alt', 0), ('and', 0), ('or', 0), ('xor', 0),
+    ('not', 0), ('neg', 0), ('invert', 0), ('add.c', 1),
+    ('smul.c', 1), ('zero.pri', 0), ('zero.alt', 0), ('zero', 1),
+    ('zero.s', 1), ('sign.pri', 0), ('sign.alt', 0), ('eq', 0),
+    ('neq', 0), ('less', 0), ('leq', 0), ('grtr', 0),
+    ('geq', 0), ('sless', 0), ('sleq', 0), ('sgrtr', 0),
+    ('sgeq', 0), ('eq.c.pri', 1), ('eq.c.alt', 1), ('inc.pri', 0),
+    ('inc.alt', 0), ('inc', 1), ('inc.s', 1), ('inc.i', 0),
+    ('dec.pri', 0), ('dec.alt', 0), ('dec', 1), ('dec.s', 1),
+    ('dec.i', 0), ('movs', 1), ('cmps', 1), ('fill', 1),
+    ('halt', 1), ('bounds', 1), ('sysreq.pri', 0), ('sysreq.c', 1),
+    ('file', 0), ('line', 0), ('symbol', 0), ('srange', 0),
+    ('jump.pri', 0), ('switch', 1), ('casetbl', None), ('swap.pri', 0),
+    ('swap.alt', 0), ('push.adr', 1), ('nop', 0), ('sysreq.n', 2),
+    ('symtag', 1), ('break', 0), ('push2.c', 2), ('push2', 2),
+    ('push2.s', 2), ('push2.adr', 2), ('push3.c', 3), ('push3', 3),
+    ('push3.s', 3), ('push3.adr', 3), ('push4.c', 4), ('push4', 4),
+    ('push4.s', 4), ('push4.adr', 4), ('push5.c', 5), ('push5', 5),
+    ('push5.s', 5), ('push5.adr', 5), ('load.both', 2), ('load.s.both', 2),
+    ('const', 2), ('const.s', 2), ('sysreq.d', 1), ('sysreq.nd', 2),
+    ('tracker.push.c', 1), ('tracker.pop.setheap', 0), ('genarray', 1),
+    ('genarray.z', 1), ('stradjust.pri', 0), ('stackadjust', 1),
+    ('endproc', 0), ('ldgfn', 1), ('rebase', 3), ('initarray.pri', 5),
+    ('initarray.alt', 5), ('heap.save', 0), ('heap.restore', 0),
+]
+
+MNEMONICS = [name for name, _ in OPCODES]
+OP = dict((name.upper().replace('.', '_'), opcode)
+          for opcode, name in enumerate(MNEMONICS))
+
+# Operand cells per opcode, -1 for variable-length ones
+_OPERANDS = array('i', [-1 if count is None else count
+                        for _, count in OPCODES])
+
+# Opcodes whose first operand is a native index, or a function address
+NATIVE_CALLS = (OP['SYSREQ_C'], OP['SYSREQ_N'])
+FUNCTION_CALLS = (OP['CALL'],)
+
+
+def _operand_count(cells, offset):
+    """Return the number of operand cells of the instruction at `offset`, or
+    -1 if it isn't a valid opcode"""
+    opcode = cells[offset]
+    if not 0 <= opcode < len(_OPERANDS):
+        return -1
+    count = _OPERANDS[opcode]
+    if count < 0:
+        # casetbl: a count of cases and the default address, then a value
+        # and address per case
+        if offset + 1 >= len(cells) or cells[offset + 1] < 0:
+            return -1
+        count = 2 + 2 * cells[offset + 1]
+    return count
+
+
+def _decode_cells(cells):
+    """Return the cell offset of every instruction in `cells`, one at a
+    time"""
+    offsets = array('i')
+    offset = 0
+    while offset < len(cells):
+        count = _operand_count(cells, offset)
+        if count < 0:
+            raise SourcePawnPluginFormatError(
+                'Invalid opcode %d at 0x%x' %
+                (cells[offset], offset * CELL_SIZE))
+        offsets.append(offset)
+        offset += 1 + count
+
+    if offset > len(cells):
+        raise SourcePawnPluginFormatError(
+            'Truncated instruction at 0x%x' % (offsets[-1] * CELL_SIZE))
+    return offsets
+
+
+def _decode_cells_np(cells):
+    """Return the cell offset of every instruction in `cells`
+
+    Each cell's length is looked up as though an instruction started there,
+    giving where the next one would. The instructions are then the cells
+    reachable from the first: pointer doubling finds them in log2(n) passes
+    over the arrays, not one per instruction.
+    """
+    n = len(cells)
+    operands = np.asarray(_OPERANDS, dtype=np.int64)
+    known = (cells >= 0) & (cells < len(operands))
+    counts = np.full(n, -1, dtype=np.int64)
+    counts[known] = operands[cells[known]]
+
+    casetbl = np.flatnonzero(cells == OP['CASETBL'])
+    casetbl = casetbl[casetbl + 1 < n]
+    cases = cells[casetbl + 1].astype(np.int64)
+    counts[casetbl] = np.where(cases >= 0, 2 + 2 * cases, -1)
+
+    # Successor of each cell, with n as the end (and its own successor)
+    jump = np.arange(1, n + 2, dtype=np.int64)
+    jump[:n] += counts
+    jump[:n][counts < 0] = n
+    np.minimum(jump, n, out=jump)
+    jump[n] = n
+
+    reached = np.zeros(n + 1, dtype=bool)
+    reached[0] = True
+    while jump[0] < n:
+        reached[jump[reached]] = True
+        jump = jump[jump]
+
+    offsets = np.flatnonzero(reached[:n])
+    invalid = offsets[counts[offsets] < 0]
+    if len(invalid):
+        raise SourcePawnPluginFormatError(
+            'Invalid opcode %d at 0x%x' %
+            (cells[invalid[0]], invalid[0] * CELL_SIZE))
+    if len(offsets) and offsets[-1] + 1 + counts[offsets[-1]] > n:
+        raise SourcePawnPluginFormatError(
+            'Truncated instruction at 0x%x' % (offsets[-1] * CELL_SIZE))
+    return offsets
+
+
+class Disassembly(object):
+    """The instructions of a plug-in's code, as parallel arrays
+
+    cells are the code cells; offsets[i] is the cell index of instruction
+    i and opcodes[i] its opcode, with operands in the cells following it.
+    Addresses are byte offsets into the code, as in the code itself.
+    """
+
+    def __init__(self, cells, native_names=(), public_names=None):
+        """Decode `cells`, naming calls after `native_names` (by index) and
+        `public_names` (a dict by address)"""
+        if np is not None and not isinstance(cells, array):
+            cells = np.asarray(cells, dtype=np.int32)
+        self.cells = cells
+        if np is not None and not isinstance(cells, array):
+            self.offsets = _decode_cells_np(cells)
+            self.opcodes = cells[self.offsets]
+        else:
+            self.offsets = _decode_cells(cells)
+            self.opcodes = array('i', (cells[offs] for offs in self.offsets))
+
+        self.native_names = list(native_names)
+        self.public_names = dict(public_names or ())
+        self._index_calls()
+
+    @classmethod
+    def from_plugin(cls, plugin):
+        """Disassemble the .code section of `plugin`"""
+        code = plugin._code()
+        if code is None:
+            raise SourcePawnPluginFormatError('.code section not found')
+
+        sect, cod, start = code
+        size = cod.codesize // CELL_SIZE * CELL_SIZE
+        if start + size > sect.dataoffs + sect.size:
+            raise SourcePawnPluginFormatError(
+                'Code runs past the end of the .code section')
+
+        code = bytes(plugin._image[start:start + size])
+        if np is not None:
+            cells = np.frombuffer(code, '<i4')
+        else:
+            cells = array('i', code)
+            if sys.byteorder != 'little':
+                cells.byteswap()
+
+        # Public.code_offs is relative to .data's; undo that to get back
+        # the address calls use
+        public_names = dict((public.code_offs - plugin.data, public.name)
+                            for public in plugin.publics or ())
+        native_names = [native.name for native in plugin.natives or ()]
+        return cls(cells, native_names, public_names)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _index_calls(self):
+        """Find the call sites of natives and functions, and the function
+        (the nearest proc at or before it) each one is in"""
+        if np is not None and not isinstance(self.offsets, array):
+            opcodes = self.opcodes
+            self.functions = self.offsets[opcodes == OP['PROC']] * CELL_SIZE
+            native = np.isin(opcodes, NATIVE_CALLS)
+            call = np.isin(opcodes, FUNCTION_CALLS)
+            self.native_sites = self.offsets[native] * CELL_SIZE
+            self.native_targets = self.cells[self.offsets[native] + 1]
+            self.call_sites = self.offsets[call] * CELL_SIZE
+            self.call_targets = self.cells[self.offsets[call] + 1]
+            return
+
+        self.functions = array('i')
+        self.native_sites, self.native_targets = array('i'), array('i')
+        self.call_sites, self.call_targets = array('i'), array('i')
+        for offs, opcode in zip(self.offsets, self.opcodes):
+            if opcode == OP['PROC']:
+                self.functions.append(offs * CELL_SIZE)
+            elif opcode in NATIVE_CALLS:
+                self.native_sites.append(offs * CELL_SIZE)
+                self.native_targets.append(self.cells[offs + 1])
+            elif opcode in FUNCTION_CALLS:
+                self.call_sites.append(offs * CELL_SIZE)
+                self.call_targets.append(self.cells[offs + 1])
+
+    def function_of(self, address):
+        """Return the address of the function containing `address`, or None
+        if it comes before the first proc"""
+        lo, hi = 0, len(self.functions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.functions[mid] <= address:
+                lo = mid + 1
+            else:
+                hi = mid
+        return int(self.functions[lo - 1]) if lo else None
+
+    def function_name(self, address):
+        """Return the public name of the function at `address`, or a name
+        made up from its address"""
+        return self.public_names.get(address, 'func_%x' % address)
+
+    def native_name(self, index):
+        if 0 <= index < len(self.native_names):
+            return self.native_names[index]
+        return 'native_%d' % index
+
+    def xrefs(self):
+        """Return a dict of each native and function called to the sorted
+        addresses of the functions calling it"""
+        callers = {}
+        for site, index in zip(self.native_sites, self.native_targets):
+            callers.setdefault(self.native_name(int(index)), set()).add(
+                self.function_of(int(site)))
+        for site, target in zip(self.call_sites, self.call_targets):
+            callers.setdefault(self.function_name(int(target)), set()).add(
+                self.function_of(int(site)))
+        return dict((name, sorted(funcs, key=lambda f: (f is None, f)))
+                    for name, funcs in callers.items())
+
+    def operands(self, i):
+        """Return the operands of instruction `i`"""
+        start = int(self.offsets[i]) + 1
+        end = (int(self.offsets[i + 1]) if i + 1 < len(self.offsets)
+               else len(self.cells))
+        return [int(cell) for cell in self.cells[start:end]]
+
+    def __iter__(self):
+        """Yield (address, mnemonic, operands) for every instruction"""
+        for i, opcode in enumerate(self.opcodes):
+            yield (int(self.offsets[i]) * CELL_SIZE, MNEMONICS[opcode],
+                   self.operands(i))
+
+    def listing(self):
+        """Yield the lines of a text listing, with calls annotated"""
+        for i, opcode in enumerate(self.opcodes):
+            address = int(self.offsets[i]) * CELL_SIZE
+            operands = self.operands(i)
+            if address in self.public_names:
+                yield '%s:' % self.public_names[address]
+            line = '%08x  %-14s %s' % (address, MNEMONICS[opcode],
+                                      ' '.join(map(str, operands)))
+            if opcode in NATIVE_CALLS:
+                line += '  ; %s' % self.native_name(operands[0])
+            elif opcode in FUNCTION_CALLS:
+                line += '  ; %s' % self.function_name(operands[0])
+            yield line.rstrip()
+
+
+def disassemble(plugin):
+    """Return the Disassembly of `plugin`'s code"""
+    return Disassembly.from_plugin(plugin)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path', help='.smx file to disassemble')
+    parser.add_argument('--xrefs', action='store_true',
+                        help='list callers of each native and function '
+                             'instead')
+    args = parser.parse_args(argv)
+
+    with SourcePawnPlugin.from_file(args.path, lazy=True) as plugin:
+        dis = disassemble(plugin)
+    if args.xrefs:
+        for name, funcs in sorted(dis.xrefs().items()):
+            print('%s: %s' % (name, ' '.join(
+                '-' if func is None else dis.function_name(func)
+                for func in funcs)))
+    else:
+        for line in dis.listing():
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
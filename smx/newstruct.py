@@ -1,4 +1,11 @@
 import ctypes
+import struct
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 __ctypes__ = [
     'c_bool',
@@ -90,18 +97,35 @@ class StructField(object):
         StructField.creation_counter += 1
 field = StructField
 
+def _struct_format(ctyp):
+    """Return the standard-size struct module format of a simple ctype, or
+    None if it has none"""
+    code = getattr(ctyp, '_type_', None)
+    if not isinstance(code, str):
+        return None
+
+    # Padding is spelled out from ctypes' offsets, so formats are standard
+    # size; the native codes' sizes differ for some types (e.g. c_long)
+    if code in 'bBhHiIlLqQnN':
+        size_code = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}[ctypes.sizeof(ctyp)]
+        return size_code.upper() if code.isupper() else size_code
+    if code in 'cfd?':
+        return code
+    return None
+
+
 class StructBase(type(ctypes.Structure)):
     def __new__(cls, name, bases, attrs):
         fields = []
         order = {}
         module = attrs.pop('__module__')
         new_attrs = { '__module__': module }
-        for name,value in attrs.items():
+        for attr_name, value in attrs.items():
             if isinstance(value, StructField):
-                fields.append((name, value.ctyp))
-                order[name] = value.creation_counter
+                fields.append((attr_name, value.ctyp))
+                order[attr_name] = value.creation_counter
             else:
-                new_attrs[name] = value
+                new_attrs[attr_name] = value
 
         fields = sorted(fields, key=lambda o: order[o[0]])
 
@@ -115,14 +139,47 @@ class StructBase(type(ctypes.Structure)):
 
         super_new = super(StructBase, cls).__new__
         new_class = super_new(cls, name, bases, new_attrs)
+        new_class._compile_struct()
 
         return new_class
 
+    def _compile_struct(cls):
+        """Precompile the layout as a struct.Struct, `_struct_`, and a
+        namedtuple type for its records, `_record_`
+
+        Fields (those of base Structs first, as ctypes lays them out) sit at
+        the offsets ctypes gives them, with padding, tail padding included,
+        spelled out -- so consecutive records are ctypes.sizeof() apart.
+        Both are None if some field has no struct module equivalent.
+        """
+        cls._struct_ = cls._record_ = None
+
+        cls._layout_ = [
+            (field_name, ctyp, getattr(cls, field_name).offset)
+            for klass in reversed(cls.__mro__)
+            for field_name, ctyp in klass.__dict__.get('_fields_', ())]
+
+        formats = []
+        end = 0
+        for _, ctyp, offset in cls._layout_:
+            code = _struct_format(ctyp)
+            if code is None:
+                return
+            if offset > end:
+                formats.append('%dx' % (offset - end))
+            formats.append(code)
+            end = offset + ctypes.sizeof(ctyp)
+        if ctypes.sizeof(cls) > end:
+            formats.append('%dx' % (ctypes.sizeof(cls) - end))
 
-class Struct(ctypes.Structure):
-    __metaclass__ = StructBase
+        packed = getattr(cls, '_pack_', 0) == 1
+        cls._struct_ = struct.Struct(('<' if packed else '=') + ''.join(formats))
+        cls._record_ = namedtuple(cls.__name__ + 'Record',
+                                  [field_name for field_name, _, _ in cls._layout_])
 
-    def __init__(self, base=None, offset=None, size=None, buf=None):
+
+class Struct(ctypes.Structure, metaclass=StructBase):
+    def __init__(self, base=None, offset=0, size=None, buf=None):
         ctypes.Structure.__init__(self)
 
         _buf = None
@@ -131,14 +188,58 @@ class Struct(ctypes.Structure):
         elif base is not None:
             if size is None:
                 size = ctypes.sizeof(self)
-            _buf = buffer(base, offset, size)
+            _buf = memoryview(base)[offset:offset + size]
 
         if _buf is not None:
             self.pack_into(_buf)
 
     def pack_into(self, buffer):
         fit = min(len(buffer), ctypes.sizeof(self))
-        ctypes.memmove(ctypes.addressof(self), buffer[:], fit)
+        ctypes.memmove(ctypes.addressof(self), bytes(buffer[:fit]), fit)
+
+    @classmethod
+    def unpack_from(cls, base, offset=0):
+        """Return the record at `offset` into `base` as a namedtuple, decoded
+        by the precompiled struct"""
+        return cls._record_._make(cls._struct_.unpack_from(base, offset))
+
+    @classmethod
+    def iter_unpack(cls, base, offset, count):
+        """Return an iterator over `count` consecutive records at `offset`
+        into `base`, as namedtuples"""
+        end = offset + count * cls._struct_.size
+        return map(cls._record_._make,
+                   cls._struct_.iter_unpack(memoryview(base)[offset:end]))
+
+    @classmethod
+    def dtype(cls):
+        """Return the NumPy structured dtype matching this layout"""
+        if np is None:
+            raise ImportError('NumPy is required for record array views')
+
+        dtype = cls.__dict__.get('_dtype_')
+        if dtype is None:
+            packed = getattr(cls, '_pack_', 0) == 1
+            formats = [np.dtype(ctyp) for _, ctyp, _ in cls._layout_]
+            if packed:
+                formats = [fmt.newbyteorder('<') for fmt in formats]
+            dtype = np.dtype({
+                'names': [field_name for field_name, _, _ in cls._layout_],
+                'formats': formats,
+                'offsets': [offset for _, _, offset in cls._layout_],
+                'itemsize': ctypes.sizeof(cls),
+            })
+            cls._dtype_ = dtype
+        return dtype
+
+    @classmethod
+    def array_view(cls, base, offset, count):
+        """Return `count` consecutive records at `offset` into `base` as a
+        NumPy structured array, viewing `base` in place
+
+        Fields are columns, so e.g. view['name'] holds every record's name.
+        """
+        return np.frombuffer(base, cls.dtype(), count, offset)
 
 
 class NoAlignStruct(Struct):
@@ -147,7 +248,7 @@ class NoAlignStruct(Struct):
 
 glb = globals()
 ctyp_found = []
-for name,field_name in zip(__ctypes__, __cftypes__):
+for name, field_name in zip(__ctypes__, __cftypes__):
     if not hasattr(ctypes, name):
         continue
     ctyp = getattr(ctypes, name)
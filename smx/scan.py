@@ -0,0 +1,143 @@
+#!/bin/env python3
+"""Inventory every .smx plug-in under some directories, as JSON lines
+
+Plug-ins are parsed in a process pool, and one line is written per plug-in
+as soon as it's done -- so output order follows completion, not the tree.
+Plug-ins which fail to parse get a line with an "error" instead.
+
+    python scan.py /srv/tf2/addons/sourcemod/plugins > inventory.jsonl
+
+With --cache, summaries are kept in a SQLite database, and plug-ins whose
+files haven't changed since the last scan are not parsed again.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from multiprocessing import Pool
+
+from smxreader import SourcePawnPlugin, SourcePawnPluginError
+
+
+def find_plugins(paths):
+    """Yield the path of every .smx file under `paths`"""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith('.smx'):
+                    yield os.path.join(dirpath, filename)
+
+
+def describe_plugin(path):
+    """Return a JSON-serializable summary of the plug-in at `path`"""
+    try:
+        with SourcePawnPlugin.from_file(path, lazy=True) as plugin:
+            record = {
+                'path': path,
+                'disksize': plugin.disksize,
+                'imagesize': plugin.imagesize,
+                'compression': plugin.compression,
+                'myinfo': getattr(plugin, 'myinfo', {}),
+                'publics': [public.name for public in plugin.publics or ()],
+                'pubvars': [pubvar.name for pubvar in plugin.pubvars or ()],
+            }
+
+            if plugin.pcode is not None:
+                record['codeversion'] = plugin.pcode.version
+                record['codesize'] = plugin.pcode.size
+
+        return record
+
+    except (SourcePawnPluginError, OSError, ValueError, struct.error,
+            zlib.error) as e:
+        return {'path': path, 'error': str(e)}
+
+
+def scan(paths, out, processes=None, chunksize=16, cache=None):
+    """Describe every plug-in under `paths`, writing JSON lines to `out`
+
+    If a PluginCache is given, plug-ins found in it are written straight
+    away, and only the rest are parsed (and then stored, unless they failed:
+    the failure may be passing, like a permissions error).
+
+    Returns the number of plug-ins described.
+    """
+    count = 0
+    if cache is None:
+        pending = find_plugins(paths)
+    else:
+        stats = {}
+        for path in find_plugins(paths):
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                # Gone (or unreadable) since it was found
+                out.write(json.dumps({'path': path, 'error': str(e)},
+                                     sort_keys=True) + '\n')
+                count += 1
+                continue
+
+            record = cache.lookup(path, st)
+            if record is None:
+                stats[path] = st
+            else:
+                out.write(record + '\n')
+                count += 1
+        pending = list(stats)
+        if not pending:
+            return count
+
+    pool = Pool(processes)
+    try:
+        for record in pool.imap_unordered(describe_plugin, pending, chunksize):
+            line = json.dumps(record, sort_keys=True)
+            out.write(line + '\n')
+            count += 1
+
+            if cache is not None and 'error' not in record:
+                cache.store(record['path'], stats[record['path']], line)
+        return count
+    finally:
+        pool.close()
+        pool.join()
+        if cache is not None:
+            cache.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('paths', nargs='+', metavar='path',
+                        help='plug-in directory (or .smx file) to scan')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='file to write JSON lines to (default: stdout)')
+    parser.add_argument('--cache', default=None, metavar='DB',
+                        help='SQLite database of summaries to reuse and update')
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache is not None:
+        from cache import PluginCache
+        cache = PluginCache(args.cache)
+
+    try:
+        if args.output == '-':
+            scan(args.paths, sys.stdout, args.processes, cache=cache)
+        else:
+            with open(args.output, 'w') as out:
+                scan(args.paths, out, args.processes, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Build synthetic .smx plug-ins, for tests"""
+import struct
+import zlib
+
+PROC, RETN = 46, 48
+
+MYINFO = {
+    'name': 'Test Plugin',
+    'description': 'A synthetic plug-in',
+    'author': 'someone',
+    'version': '1.0',
+    'url': 'http://example.com',
+}
+
+
+def _cstring(s):
+    return s.encode('utf-8') + b'\0'
+
+
+def build_smx(publics=('OnPluginStart', 'OnMapStart', 'OnClientConnected'),
+              natives=('PrintToServer', 'GetClientCount'), code=None,
+              myinfo=MYINFO, compress=False, code_first=True):
+    """Return the bytes of a synthetic .smx plug-in
+
+    `publics` are names, placed at successive `proc; retn` pairs of the
+    default code, or (name, address) pairs into the given `code` cells.
+    .code is the first section unless `code_first` is false, when it
+    follows .data.
+    """
+    publics = [(public, i * 8) if isinstance(public, str) else public
+               for i, public in enumerate(publics)]
+    if code is None:
+        code = [PROC, RETN] * len(publics)
+
+    names = bytearray()
+
+    def name(s):
+        offs = len(names)
+        names.extend(_cstring(s))
+        return offs
+
+    # myinfo's strings, then the struct pointing at them
+    data = bytearray()
+    info = []
+    for key in ('name', 'description', 'author', 'version', 'url'):
+        info.append(len(data))
+        data.extend(_cstring(myinfo[key]))
+    data.extend(b'\0' * (-len(data) % 4))
+    myinfo_addr = len(data)
+    data.extend(struct.pack('<5I', *info))
+
+    code_cells = struct.pack('<%di' % len(code), *code)
+    sections = [
+        ('.code', struct.pack('<IBBHII', len(code_cells), 4, 10, 0, 0, 16) +
+                  code_cells),
+        ('.data', struct.pack('<III', len(data), len(data) + 64, 12) +
+                  bytes(data)),
+        ('.publics', b''.join(struct.pack('<II', address, name(public))
+                              for public, address in publics)),
+        ('.pubvars', struct.pack('<II', myinfo_addr, name('myinfo'))),
+        ('.natives', b''.join(struct.pack('<I', name(native))
+                              for native in natives)),
+    ]
+    sections.append(('.names', bytes(names)))
+    if not code_first:
+        sections[0:2] = sections[1::-1]
+
+    sectnames = bytearray()
+    header_size = 24
+    stringtab = header_size + 12 * len(sections)
+    dataoffs = stringtab + sum(len(_cstring(n)) for n, _ in sections)
+
+    table = bytearray()
+    body = bytearray()
+    for sectname, blob in sections:
+        table += struct.pack('<III', len(sectnames), dataoffs + len(body),
+                             len(blob))
+        sectnames += _cstring(sectname)
+        body += blob
+
+    stored = zlib.compress(bytes(body)) if compress else bytes(body)
+    header = struct.pack('<IHBIIBII', 0x53504646, 0x0102, int(compress),
+                         dataoffs + len(stored), dataoffs + len(body),
+                         len(sections), stringtab, dataoffs)
+    return header + bytes(table) + bytes(sectnames) + stored
@@ -1,7 +1,16 @@
+import mmap
+import os
 import zlib
 from ctypes import *
+from functools import cached_property
+
 from newstruct import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 SPFILE_MAGIC    = 0x53504646
 SPFILE_VERSION  = 0x0102
 
@@ -18,13 +27,153 @@ class SourcePawnPluginFormatError(SourcePawnPluginError):
     pass
 
 
+def _read_cstring(base, offset):
+    """Return the NUL-terminated string at `offset` into `base`, copying only
+    the string itself"""
+    end = base.find(b'\0', offset)
+    if end < 0:
+        raise SourcePawnPluginFormatError(
+            'Unterminated string at offset 0x%x' % offset)
+    return bytes(base[offset:end]).decode('utf-8', 'replace')
+
+
+class StringTable(object):
+    """The NUL-terminated strings in a region of an image, by offset
+
+    Each string is found (by searching only as far as its terminator),
+    decoded and memoized the first time it's looked up, so resolving a name
+    costs its own length once, and a dict lookup thereafter.
+    """
+
+    def __init__(self, base, start, end):
+        self.base = base
+        self.start = start
+        self.end = end
+        self._strings = {}
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, offset):
+        try:
+            return self._strings[offset]
+        except KeyError:
+            pass
+
+        start = self.start + offset
+        end = self.base.find(b'\0', start, self.end)
+        if end < 0:
+            raise SourcePawnPluginFormatError(
+                'Unterminated string at offset 0x%x' % start)
+
+        string = bytes(self.base[start:end]).decode('utf-8', 'replace')
+        self._strings[offset] = string
+        return string
+
+    def lookup_many(self, offsets):
+        """Return the strings at each of `offsets`
+
+        With NumPy, the terminators of every string not yet memoized are found
+        in one pass over the table.
+        """
+        strings = self._strings
+        missing = [offs for offs in offsets if offs not in strings]
+
+        if np is not None and len(missing) > 1:
+            table = np.frombuffer(self.base, np.uint8, len(self), self.start)
+            nuls = np.flatnonzero(table == 0)
+            starts = np.asarray(missing, dtype=np.intp)
+            ends = np.searchsorted(nuls, starts)
+            if ends.max() >= len(nuls):
+                raise SourcePawnPluginFormatError(
+                    'Unterminated string in table at offset 0x%x' %
+                    self.start)
+
+            blob = table.tobytes()
+            for start, end in zip(starts.tolist(), nuls[ends].tolist()):
+                strings[start] = blob[start:end].decode('utf-8', 'replace')
+
+        return [self[offs] for offs in offsets]
+
+
+class _Inflater(object):
+    """Decompresses an image into a buffer allocated up front, incrementally
+
+    The uncompressed headers are copied to the front of `image`, and the rest
+    is filled in a chunk at a time, only as far as ensure() is asked for -- so
+    sections near the start can be parsed before the rest is decompressed,
+    and no second copy of the image is ever made.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, head, compressed, dataoffs, imagesize):
+        self.image = bytearray(imagesize)
+        self.image[:dataoffs] = head[:dataoffs]
+        self.filled = dataoffs
+
+        self._compressed = compressed
+        self._pos = 0
+        self._z = zlib.decompressobj()
+
+    def ensure(self, end):
+        """Decompress until the image is filled up to (not including) `end`"""
+        image = self.image
+        while self.filled < end and self._z is not None:
+            chunk = self._compressed[self._pos:self._pos + self.CHUNK_SIZE]
+            self._pos += len(chunk)
+
+            if chunk:
+                out = self._z.decompress(chunk)
+            else:
+                out = self._z.flush()
+                self._z = None
+
+            if self.filled + len(out) > len(image):
+                raise SourcePawnPluginFormatError(
+                    'Image is larger than the %d bytes its header claims' %
+                    len(image))
+            image[self.filled:self.filled + len(out)] = out
+            self.filled += len(out)
+
+        if self.filled < end:
+            raise SourcePawnPluginFormatError(
+                'Image is smaller than the %d bytes its header claims' %
+                len(image))
+        if self.filled == len(image) and self._z is not None:
+            self._finish()
+
+    def _finish(self):
+        """Make sure nothing more follows the full image"""
+        # Asking for a single byte of output is enough to tell, however much
+        # the rest would inflate to
+        out = self._z.decompress(self._compressed[self._pos:], 1)
+        self._pos = len(self._compressed)
+        if out or self._z.unconsumed_tail:
+            raise SourcePawnPluginFormatError(
+                'Image is larger than the %d bytes its header claims' %
+                len(self.image))
+        if self._z.unused_data:
+            raise SourcePawnPluginFormatError(
+                'Image is followed by %d bytes of trailing data' %
+                len(self._z.unused_data))
+        self._z = None
+
+    def close(self):
+        """Stop decompressing, releasing the compressed data"""
+        if isinstance(self._compressed, memoryview):
+            self._compressed.release()
+        self._compressed = b''
+        self._z = None
+
+
 def _extract_strings(buffer, num_strings=1):
     strings = []
     offset = 0
-    for i in xrange(num_strings):
-        s = c_char_p(buffer[offset:]).value
+    for i in range(num_strings):
+        s = _read_cstring(buffer, offset)
         strings.append(s)
-        offset += len(s)+1
+        offset += len(s.encode('utf-8'))+1
     return tuple(strings)
 
 
@@ -65,6 +214,9 @@ class SourcePawnPlugin(object):
         address = cf_uint32()
         name = cf_uint32()
 
+    class sp_file_natives(NoAlignStruct):
+        name = cf_uint32()
+
 
     class PCode(object):
         def __init__(self, plugin, pcode, size, version, flags):
@@ -83,6 +235,13 @@ class SourcePawnPlugin(object):
             self.name = name
 
 
+    class Native(object):
+        def __init__(self, plugin, index, name):
+            self.plugin = plugin
+            self.index = index
+            self.name = name
+
+
     class Pubvar(object):
         class Myinfo(NoAlignStruct):
             name = cf_uint32()
@@ -98,10 +257,11 @@ class SourcePawnPlugin(object):
 
             # Special case for myinfo
             if self.name == 'myinfo':
-                myinfo_offs = self.Myinfo(self.plugin.base, self.offs)
-                self.myinfo = dict(map(
-                    lambda o: (o[0],self.plugin._get_data_string(getattr(
-                        myinfo_offs, o[0]))), myinfo_offs._fields_))
+                myinfo_offs = self.Myinfo.unpack_from(self.plugin._image,
+                                                      self.offs)
+                self.myinfo = dict(
+                    (key, self.plugin._get_data_string(offs))
+                    for key, offs in myinfo_offs._asdict().items())
 
         @property
         def value(self):
@@ -113,21 +273,81 @@ class SourcePawnPlugin(object):
         return self.Public(self, code_offs, funcid, name)
     def _pcode(self, pcode, size, version, flags):
         return self.PCode(self, pcode, size, version, flags)
-
-
-    def __init__(self, filelike=None):
-        self.base = None
+    def _native(self, index, name):
+        return self.Native(self, index, name)
+
+    # Layouts of the sections which are arrays of records
+    _RECORD_LAYOUTS = {
+        '.publics': sp_file_publics,
+        '.pubvars': sp_file_pubvars,
+        '.natives': sp_file_natives,
+    }
+
+    # Attributes decoded from the image on first access
+    _LAZY_ATTRIBUTES = ('base', 'strings', 'pcode', 'data', 'data_strings',
+                        'publics', 'pubvars', 'natives', 'myinfo')
+
+    def __init__(self, filelike=None, lazy=False):
+        """Load a plug-in from the file object `filelike`, if given
+
+        With lazy=True, only the section directory is read up front. Each
+        section is decoded (and a compressed image decompressed as far as it)
+        the first time an attribute needing it is accessed -- so reading just
+        .myinfo never touches the code, publics or natives.
+        """
+        self.lazy = lazy
         self.stringbase = None
         self.stringtab = None
-
-        self.pubvars = None
-        self.publics = None
-        self.data = None
-        self.pcode = None
-
-        if buffer is not None:
+        self.dataoffs = None
+        self.compression = None
+        self.disksize = None
+        self.imagesize = None
+        self.sections = {}
+        self._image = None
+        self._inflater = None
+        self._mmap = None
+
+        if filelike is not None:
             self.extract_from_buffer(filelike)
 
+    @classmethod
+    def from_file(cls, path, lazy=False):
+        """Load a plug-in from the .smx at `path`, via extract_from_file()"""
+        plugin = cls(lazy=lazy)
+        plugin.extract_from_file(path)
+        return plugin
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the image, and the memory map behind it if there is one,
+        leaving the plug-in empty
+
+        Record arrays returned by records() view the map, which stays open
+        until they're released.
+        """
+        for name in self._LAZY_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        self.sections = {}
+        self._image = None
+
+        inflater, self._inflater = self._inflater, None
+        if inflater is not None:
+            inflater.close()
+
+        mm, self._mmap = self._mmap, None
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                # Something still views the map (a record array, or the locals
+                # of a traceback); it's unmapped when that goes away instead
+                pass
+
     def __str__(self):
         if hasattr(self, 'myinfo'):
             return str(self.myinfo['name'] + ' by ' + self.myinfo['author'])
@@ -147,23 +367,116 @@ class SourcePawnPlugin(object):
 
     flags = property(_get_flags, _set_flags)
 
+    def _need(self, end):
+        """Make sure the image is available up to `end`"""
+        if self._inflater is not None:
+            self._inflater.ensure(end)
+
+    def _section(self, name):
+        """Return the directory entry of section `name` (or None), making sure
+        all of its contents are available"""
+        sect = self.sections.get(name)
+        if sect is not None:
+            self._need(sect.dataoffs + sect.size)
+        return sect
+
     def _get_data_string(self, dataoffset):
-        return c_char_p(self.base[self.data + dataoffset:]).value
+        return self.data_strings[dataoffset]
 
     def _get_string(self, stroffset):
-        return c_char_p(self.base[self.stringbase + stroffset:]).value
+        return self.strings[stroffset]
+
+    def _get_strings(self, stroffsets):
+        return self.strings.lookup_many(stroffsets)
+
+    def records(self, name):
+        """Return the records of section `name` (.publics, .pubvars or
+        .natives) as a NumPy structured array viewing the image in place, or
+        None if there's no such section"""
+        layout = self._RECORD_LAYOUTS[name]
+        sect = self._section(name)
+        if sect is None:
+            return None
+        return layout.array_view(self._image, sect.dataoffs,
+                                 sect.size // sizeof(layout))
+
+    def _columns(self, name, *fields):
+        """Return lists of the values of `fields` over the records of section
+        `name`"""
+        if np is not None:
+            records = self.records(name)
+            return [records[field].tolist() for field in fields]
+
+        sect = self.sections[name]
+        layout = self._RECORD_LAYOUTS[name]
+        end = sect.dataoffs + sect.size // sizeof(layout) * sizeof(layout)
+        rows = layout._struct_.iter_unpack(
+            memoryview(self._image)[sect.dataoffs:end])
+        columns = dict(zip(layout._record_._fields, zip(*rows)))
+        return [list(columns.get(field, ())) for field in fields]
+
+    def _read_header(self, head):
+        """Unpack and check the file header at the start of `head`"""
+        _hdr_size = sizeof(self.sp_file_hdr)
+        if len(head) < _hdr_size:
+            raise SourcePawnPluginFormatError(
+                'File is too short (%d bytes) to hold a %d-byte header' %
+                (len(head), _hdr_size))
 
-    def extract_from_buffer(self, fp):
-        hdr = self.sp_file_hdr(buf=fp.read(sizeof(self.sp_file_hdr)))
+        hdr = self.sp_file_hdr.unpack_from(head)
+        self._check_header(hdr)
+        return hdr
 
+    def _check_header(self, hdr):
         if hdr.magic != SPFILE_MAGIC:
             raise SourcePawnPluginFormatError(
                 'Invalid magic number 0x%08x (expected 0x%08x)' %
                 (hdr.magic, SPFILE_MAGIC))
 
-        self.stringtab = hdr.stringtab
+        if hdr.compression not in (SPFILE_COMPRESSION_NONE,
+                                   SPFILE_COMPRESSION_GZ):
+            raise SourcePawnPluginError('Invalid compression type %d' %
+                                        hdr.compression)
+
+    def extract_from_file(self, path):
+        """Load the .smx at `path` through a memory map
+
+        An uncompressed image is parsed in place: headers and record arrays
+        are unpacked straight from the map, and strings are copied out one
+        at a time, so no more of the file is read than is looked at. The map
+        is copy-on-write, so views over it are writable without touching the
+        file.
+        """
+        self.close()
+        with open(path, 'rb') as fp:
+            # An empty file can't be mapped
+            if not os.fstat(fp.fileno()).st_size:
+                raise SourcePawnPluginFormatError('File is empty')
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+        self._mmap = mm
+
+        try:
+            hdr = self._read_header(mm)
+
+            if hdr.compression == SPFILE_COMPRESSION_GZ:
+                compsize = hdr.disksize - hdr.dataoffs
+                compdata = memoryview(mm)[hdr.dataoffs:hdr.dataoffs + compsize]
+                inflater = _Inflater(mm, compdata,
+                                     hdr.dataoffs, hdr.imagesize)
+                self._extract_image(hdr, mm, inflater.image, inflater)
+
+            else:
+                self._extract_image(hdr, mm, mm)
+
+        except BaseException:
+            self.close()
+            raise
+
+    def extract_from_buffer(self, fp):
+        self.close()
+        _hdr_size = sizeof(self.sp_file_hdr)
+        hdr = self._read_header(fp.read(_hdr_size))
 
-        _hdr_size = sizeof(hdr)
         if hdr.compression == SPFILE_COMPRESSION_GZ:
             uncompsize = hdr.imagesize - hdr.dataoffs
             compsize = hdr.disksize - hdr.dataoffs
@@ -174,91 +487,166 @@ class SourcePawnPlugin(object):
             fp.seek(0)
             fileheader = fp.read(_hdr_size)
 
-            uncompdata = zlib.decompress(compdata, 15, uncompsize)
-            base = fileheader + sectheader + uncompdata
+            inflater = _Inflater(fileheader + sectheader, compdata,
+                                 hdr.dataoffs, hdr.imagesize)
+            self._extract_image(hdr, inflater.image, inflater.image, inflater)
 
-        elif hdr.compression == SPFILE_COMPRESSION_NONE:
+        else:
             fp.seek(0)
             base = fp.read()
+            self._extract_image(hdr, base, base)
+
+    def _extract_image(self, hdr, head, image, inflater=None):
+        """Read the section directory, and unless lazy, decode every section
+
+        `head` holds at least the file's uncompressed headers, and `image`
+        the whole image -- or, if an `inflater` is given, the buffer it
+        decompresses the image into on demand. Either may be anything
+        supporting slicing and find(); an mmap or bytearray is viewed in
+        place, rather than copied.
+        """
+        for name in self._LAZY_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        self._image = image
+        self._inflater = inflater
 
-        else:
-            raise SourcePawnPluginError('Invalid compression type %d' %
-                                        hdr.compression)
-
-        self.base = buffer(base)
-
-        sect = self.sp_file_section()
-        _sectsize = sizeof(sect)
-        for sectnum in xrange(hdr.sections):
-            sect.pack_into(buffer(self.base, _hdr_size + sectnum * _sectsize))
-            name = c_char_p(buffer(self.base,
-                                   self.stringtab + sect.nameoffs)[:]).value
-            if name == '.names':
-                self.stringbase = sect.dataoffs
-                break
-
-        if self.stringbase is None:
+        self.stringtab = hdr.stringtab
+        self.dataoffs = hdr.dataoffs
+        self.compression = hdr.compression
+        self.disksize = hdr.disksize
+        self.imagesize = hdr.imagesize
+
+        _hdr_size = sizeof(self.sp_file_hdr)
+        _sections_end = _hdr_size + hdr.sections * sizeof(self.sp_file_section)
+        if len(head) < max(_sections_end, hdr.dataoffs):
+            raise SourcePawnPluginFormatError(
+                'File is truncated within its %d bytes of headers' %
+                max(_sections_end, hdr.dataoffs))
+
+        self.sections = {}
+        for sect in self.sp_file_section.iter_unpack(
+                head, _hdr_size, hdr.sections):
+            name = _read_cstring(head, self.stringtab + sect.nameoffs)
+            if sect.dataoffs + sect.size > len(image):
+                raise SourcePawnPluginFormatError(
+                    'Section %s runs past the end of the %d-byte image' %
+                    (name, len(image)))
+            self.sections.setdefault(name, sect)
+
+        if '.names' not in self.sections:
             raise SourcePawnPluginError('Could not locate string base')
-
-        for sectnum in xrange(hdr.sections):
-            sect.pack_into(buffer(self.base, _hdr_size + sectnum * _sectsize))
-            sectnameoff = self.stringtab + sect.nameoffs
-            sectname = c_char_p(self.base[sectnameoff:]).value
-
-            if self.pcode is None and sectname == '.code':
-                cod = self.sp_file_code(self.base, sect.dataoffs)
-                pcode = hdr.dataoffs + cod.code
-                self.pcode = self._pcode(pcode, cod.codesize, cod.codeversion,
-                                         cod.flags)
-
-            elif self.data is None and sectname == '.data':
-                dat = self.sp_file_data(self.base, sect.dataoffs)
-                self.data = sect.dataoffs + dat.data
-
-            # Functions defined as public
-            elif self.publics is None and sectname == '.public':
-                self.publics = []
-                _publicsize = sizeof(self.sp_file_publics)
-                num_publics = sect.size / _publicsize
-
-                # Make our Struct array for easy access
-                publics = (self.sp_file_publics * num_publics)()
-                memmove(addressof(publics),
-                        buffer(self.base,sect.dataoffs, sect.size)[:],
-                        sect.size)
-
-                for i in xrange(num_publics):
-                    pub = publics[i]
-                    sz_name = self._get_string(pub.name)
-                    code_offs = self.data + pub.address
-                    funcid = (i << 1) | 1
-
-                    self.publics.append(self._public(code_offs, funcid,
-                                                     sz_name))
-
-            # Variables defined as public, most importantly myinfo
-            elif self.pubvars is None and sectname == '.pubvars':
-                if self.data is None:
-                    raise SourcePawnPluginError(
-                        '.data section not found in time!')
-
-                self.pubvars = []
-                _pubvarsize = sizeof(self.sp_file_pubvars)
-                num_pubvars = sect.size / _pubvarsize
-
-                # Make our Struct array for easy access
-                pubvars = (self.sp_file_pubvars * num_pubvars)()
-                memmove(addressof(pubvars),
-                        buffer(self.base,sect.dataoffs, sect.size)[:],
-                        sect.size)
-
-                for i in xrange(num_pubvars):
-                    pubvar = pubvars[i]
-                    sz_name = self._get_string(pubvar.name)
-                    offs = self.data + pubvar.address
-
-                    pubvar = self._pubvar(offs, sz_name)
-                    self.pubvars.append(pubvar)
-
-                    if pubvar.name == 'myinfo':
-                        self.myinfo = pubvar.myinfo
+        self.stringbase = self.sections['.names'].dataoffs
+
+        if not self.lazy:
+            for name in self._LAZY_ATTRIBUTES:
+                getattr(self, name, None)
+
+    @cached_property
+    def base(self):
+        """The whole uncompressed image"""
+        if self._image is not None:
+            self._need(len(self._image))
+        return self._image
+
+    @cached_property
+    def strings(self):
+        """The .names string table, holding the names of publics, pubvars
+        and natives"""
+        sect = self._section('.names')
+        if sect is None:
+            return None
+        return StringTable(self._image, sect.dataoffs,
+                           sect.dataoffs + sect.size)
+
+    def _code(self):
+        """Return the .code section's directory entry, its header, and the
+        image offset its bytecode starts at (or None, without .code)"""
+        sect = self._section('.code')
+        if sect is None:
+            return None
+
+        cod = self.sp_file_code.unpack_from(self._image, sect.dataoffs)
+        # sp_file_code_t.code is relative to the section, not the image data
+        return sect, cod, sect.dataoffs + cod.code
+
+    @cached_property
+    def pcode(self):
+        code = self._code()
+        if code is None:
+            return None
+
+        _, cod, pcode = code
+        return self._pcode(pcode, cod.codesize, cod.codeversion, cod.flags)
+
+    @cached_property
+    def data(self):
+        sect = self._section('.data')
+        if sect is None:
+            return None
+
+        dat = self.sp_file_data.unpack_from(self._image, sect.dataoffs)
+        return sect.dataoffs + dat.data
+
+    @cached_property
+    def data_strings(self):
+        """Strings in the .data section, such as myinfo's, by offset from the
+        start of the data"""
+        sect = self._section('.data')
+        if sect is None:
+            return None
+        return StringTable(self._image, self.data, sect.dataoffs + sect.size)
+
+    @cached_property
+    def publics(self):
+        """Functions defined as public"""
+        if self._section('.publics') is None:
+            return None
+
+        publics = []
+        addresses, names = self._columns('.publics', 'address', 'name')
+
+        for i, (address, sz_name) in enumerate(
+                zip(addresses, self._get_strings(names))):
+            code_offs = self.data + address
+            funcid = (i << 1) | 1
+
+            publics.append(self._public(code_offs, funcid, sz_name))
+
+        return publics
+
+    @cached_property
+    def pubvars(self):
+        """Variables defined as public, most importantly myinfo"""
+        if self._section('.pubvars') is None:
+            return None
+
+        if self.data is None:
+            raise SourcePawnPluginError('.data section not found')
+
+        pubvars = []
+        addresses, names = self._columns('.pubvars', 'address', 'name')
+
+        for address, sz_name in zip(addresses, self._get_strings(names)):
+            offs = self.data + address
+
+            pubvars.append(self._pubvar(offs, sz_name))
+
+        return pubvars
+
+    @cached_property
+    def natives(self):
+        """Functions the plug-in imports, in the order it refers to them"""
+        if self._section('.natives') is None:
+            return None
+
+        names, = self._columns('.natives', 'name')
+        return [self._native(i, sz_name)
+                for i, sz_name in enumerate(self._get_strings(names))]
+
+    @cached_property
+    def myinfo(self):
+        for pubvar in self.pubvars or ():
+            if pubvar.name == 'myinfo':
+                return pubvar.myinfo
+        raise AttributeError('%s instance has no attribute \'myinfo\'' %
+                             type(self))
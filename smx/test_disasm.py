@@ -0,0 +1,120 @@
+import struct
+from array import array
+
+import pytest
+
+import disasm
+from disasm import OP, Disassembly
+from smxreader import SourcePawnPlugin, SourcePawnPluginFormatError
+
+# OnPluginStart, at 0:        OnMapStart, at 36:
+#   proc                        proc
+#   push.c 5                    sysreq.c 1
+#   sysreq.n 0 1                casetbl 1 0 7 0
+#   call 36                     call 0
+#   retn                        retn
+CODE = [
+    OP['PROC'], OP['PUSH_C'], 5, OP['SYSREQ_N'], 0, 1, OP['CALL'], 36,
+    OP['RETN'],
+    OP['PROC'], OP['SYSREQ_C'], 1, OP['CASETBL'], 1, 0, 7, 0, OP['CALL'], 0,
+    OP['RETN'],
+]
+PUBLICS = [('OnPluginStart', 0), ('OnMapStart', 36)]
+NATIVES = ['PrintToServer', 'GetClientCount']
+
+
+@pytest.fixture(params=['array', 'numpy'])
+def cells(request):
+    if request.param == 'numpy':
+        if disasm.np is None:
+            pytest.skip('NumPy is not installed')
+        return disasm.np.array(CODE, dtype='<i4')
+    return array('i', CODE)
+
+
+def test_decode(cells):
+    dis = Disassembly(cells, NATIVES, dict((a, n) for n, a in PUBLICS))
+
+    assert [int(offs) for offs in dis.offsets] == [
+        0, 1, 3, 6, 8, 9, 10, 12, 17, 19]
+    assert [mnemonic for _, mnemonic, _ in dis] == [
+        'proc', 'push.c', 'sysreq.n', 'call', 'retn',
+        'proc', 'sysreq.c', 'casetbl', 'call', 'retn']
+    assert dis.operands(7) == [1, 0, 7, 0]
+    assert [int(f) for f in dis.functions] == [0, 36]
+    assert dis.function_of(20) == 0
+    assert dis.function_of(36) == 36
+
+
+def test_xrefs(cells):
+    dis = Disassembly(cells, NATIVES, dict((a, n) for n, a in PUBLICS))
+    assert dis.xrefs() == {
+        'PrintToServer': [0],
+        'GetClientCount': [36],
+        'OnMapStart': [0],
+        'OnPluginStart': [36],
+    }
+
+
+def test_unnamed_calls(cells):
+    dis = Disassembly(cells)
+    assert dis.xrefs() == {
+        'native_0': [0], 'native_1': [36], 'func_24': [0], 'func_0': [36]}
+
+
+@pytest.mark.parametrize('code,message', [
+    ([OP['PROC'], 999], 'Invalid opcode 999'),
+    ([OP['PROC'], -1], 'Invalid opcode -1'),
+    ([OP['PROC'], OP['PUSH_C']], 'Truncated'),
+    ([OP['CASETBL'], 3, 0], 'Truncated'),
+])
+@pytest.mark.parametrize('kind', ['array', 'numpy'])
+def test_invalid_code(code, message, kind):
+    if kind == 'numpy':
+        if disasm.np is None:
+            pytest.skip('NumPy is not installed')
+        cells = disasm.np.array(code, dtype='<i4')
+    else:
+        cells = array('i', code)
+
+    with pytest.raises(SourcePawnPluginFormatError, match=message):
+        Disassembly(cells)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_from_plugin(make_smx, compress):
+    path = make_smx(code=CODE, publics=PUBLICS, natives=NATIVES,
+                    compress=compress)
+    with SourcePawnPlugin.from_file(path, lazy=True) as plugin:
+        dis = disasm.disassemble(plugin)
+
+    listing = list(dis.listing())
+    assert listing[0] == 'OnPluginStart:'
+    assert '00000018  call           36  ; OnMapStart' in listing
+    assert '0000000c  sysreq.n       0 1  ; PrintToServer' in listing
+    assert 'OnMapStart:' in listing
+
+
+def test_from_plugin_reads_the_plugins_code(make_smx):
+    # With .code after .data, its section offset isn't the image's
+    path = make_smx(code=CODE, publics=PUBLICS, natives=NATIVES,
+                    code_first=False)
+    with SourcePawnPlugin.from_file(path) as plugin:
+        assert plugin.sections['.code'].dataoffs != plugin.dataoffs
+        pcode = plugin.pcode
+        code = bytes(plugin.base[pcode.pcode:pcode.pcode + pcode.size])
+        dis = Disassembly.from_plugin(plugin)
+
+    assert code == struct.pack('<%di' % len(CODE), *CODE)
+    assert [int(cell) for cell in dis.cells] == CODE
+
+
+def test_main_xrefs(make_smx, capsys):
+    path = make_smx(code=CODE, publics=PUBLICS, natives=NATIVES)
+    disasm.main(['--xrefs', path])
+    assert capsys.readouterr().out.splitlines() == [
+        'GetClientCount: OnMapStart',
+        'OnMapStart: OnPluginStart',
+        'OnPluginStart: OnMapStart',
+        'PrintToServer: OnPluginStart',
+    ]
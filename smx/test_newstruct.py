@@ -0,0 +1,107 @@
+import ctypes
+import struct
+
+import pytest
+
+from newstruct import NoAlignStruct, Struct, cf_uint8, cf_uint16, cf_uint32, np
+
+
+class Packed(NoAlignStruct):
+    magic = cf_uint32()
+    version = cf_uint16()
+    flags = cf_uint8()
+    size = cf_uint32()
+
+
+class Aligned(Struct):
+    flags = cf_uint8()
+    size = cf_uint32()
+
+
+class TailPadded(Struct):
+    size = cf_uint32()
+    flags = cf_uint8()
+
+
+class Extended(TailPadded):
+    version = cf_uint8()
+
+
+class PackedExtended(Packed):
+    extra = cf_uint16()
+
+
+def test_fields_keep_declaration_order():
+    assert [name for name, _ in Packed._fields_] == [
+        'magic', 'version', 'flags', 'size']
+
+
+def test_precompiled_layouts():
+    assert Packed._struct_.format == '<IHBI'
+    assert Packed._struct_.size == ctypes.sizeof(Packed) == 11
+    assert Aligned._struct_.size == ctypes.sizeof(Aligned) == 8
+
+
+def test_tail_padding():
+    assert TailPadded._struct_.size == ctypes.sizeof(TailPadded) == 8
+
+    base = struct.pack('=IB3x', 1, 2) + struct.pack('=IB3x', 3, 4)
+    assert list(TailPadded.iter_unpack(base, 0, 2)) == [(1, 2), (3, 4)]
+
+
+@pytest.mark.parametrize('cls,fields', [
+    (Extended, ['size', 'flags', 'version']),
+    (PackedExtended, ['magic', 'version', 'flags', 'size', 'extra']),
+])
+def test_inherited_fields(cls, fields):
+    assert list(cls._record_._fields) == fields
+    assert cls._struct_.size == ctypes.sizeof(cls)
+
+
+def test_inherited_fields_follow_base_padding():
+    # version comes after TailPadded's padding, as ctypes places it
+    base = struct.pack('=IB3xB3x', 1, 2, 3)
+    assert Extended.unpack_from(base) == (1, 2, 3)
+    assert PackedExtended.unpack_from(
+        struct.pack('<IHBIH', 1, 2, 3, 4, 5)) == (1, 2, 3, 4, 5)
+
+
+def test_unpack_from():
+    base = b'xx' + struct.pack('<IHBI', 0x53504646, 0x0102, 1, 384)
+    record = Packed.unpack_from(base, 2)
+    assert record == (0x53504646, 0x0102, 1, 384)
+    assert (record.magic, record.size) == (0x53504646, 384)
+
+
+def test_iter_unpack():
+    base = b'x' + struct.pack('<IHBI', 1, 2, 3, 4) * 3
+    assert [record.size for record in Packed.iter_unpack(base, 1, 2)] == [4, 4]
+
+
+def test_struct_copies_fields_from_base():
+    packed = Packed(struct.pack('<IHBI', 7, 8, 9, 10))
+    assert (packed.magic, packed.version, packed.flags, packed.size) == (
+        7, 8, 9, 10)
+
+
+@pytest.mark.skipif(np is None, reason='NumPy is not installed')
+def test_array_view():
+    base = bytearray(b'x' + struct.pack('<IHBI', 1, 2, 3, 4) * 3)
+    records = Packed.array_view(base, 1, 3)
+
+    assert Packed.dtype().itemsize == Packed._struct_.size
+    assert records['size'].tolist() == [4, 4, 4]
+
+    # Views share the buffer
+    base[1:5] = struct.pack('<I', 99)
+    assert records['magic'][0] == 99
+
+
+@pytest.mark.skipif(np is None, reason='NumPy is not installed')
+def test_array_view_of_padded_subclass():
+    base = struct.pack('=IB3xB3x', 1, 2, 3) * 2
+    records = Extended.array_view(base, 0, 2)
+
+    assert Extended.dtype().itemsize == ctypes.sizeof(Extended)
+    assert records['version'].tolist() == [3, 3]
+    assert records['size'].tolist() == [1, 1]
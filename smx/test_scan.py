@@ -0,0 +1,122 @@
+import io
+import json
+import os
+
+import pytest
+
+import scan
+from cache import PluginCache
+from smxbuilder import MYINFO, build_smx
+
+
+def test_describe_plugin(make_smx):
+    path = make_smx(compress=True)
+    assert scan.describe_plugin(path) == {
+        'path': path,
+        'disksize': os.path.getsize(path),
+        'imagesize': len(build_smx()),
+        'compression': 1,
+        'myinfo': MYINFO,
+        'publics': ['OnPluginStart', 'OnMapStart', 'OnClientConnected'],
+        'pubvars': ['myinfo'],
+        'codeversion': 10,
+        'codesize': 24,
+    }
+
+
+@pytest.mark.parametrize('kwargs,message', [
+    ({'contents': b'FFPS\x02'}, 'too short'),
+    ({'contents': b''}, 'empty'),
+    ({'contents': b'\0' * 64}, 'magic number'),
+    ({'truncate': 100}, 'truncated'),
+    ({'compress': True, 'truncate': -10}, 'smaller'),
+])
+def test_describe_invalid_plugin(make_smx, kwargs, message):
+    path = make_smx(**kwargs)
+    record = scan.describe_plugin(path)
+    assert record['path'] == path
+    assert message in record['error']
+
+
+def test_find_plugins(make_smx, tmp_path):
+    (tmp_path / 'sub').mkdir()
+    paths = [make_smx('b.smx'), make_smx('a.SMX'), make_smx('sub/c.smx')]
+    (tmp_path / 'notes.txt').write_text('')
+
+    assert list(scan.find_plugins([str(tmp_path)])) == sorted(paths)
+    assert list(scan.find_plugins([paths[0]])) == [paths[0]]
+
+
+def test_scan(make_smx, tmp_path):
+    make_smx('good.smx')
+    make_smx('bad.smx', contents=b'FFPS\x02')
+
+    out = io.StringIO()
+    assert scan.scan([str(tmp_path)], out, processes=1) == 2
+
+    records = {os.path.basename(record['path']): record
+               for record in map(json.loads, out.getvalue().splitlines())}
+    assert records['good.smx']['myinfo'] == MYINFO
+    assert 'error' in records['bad.smx']
+
+
+def test_cache_reuses_unchanged_plugins(make_smx, tmp_path, monkeypatch):
+    path = make_smx()
+    with PluginCache(str(tmp_path / 'cache.db')) as cache:
+        assert cache.lookup(path) is None
+        record = cache.describe(path)
+        assert record['myinfo'] == MYINFO
+
+        monkeypatch.setattr('cache.describe_plugin', None)
+        assert cache.describe(path) == record
+
+        out = io.StringIO()
+        assert scan.scan([path], out, cache=cache) == 1
+        assert json.loads(out.getvalue()) == record
+
+
+def test_cache_hit_reports_path_as_scanned(make_smx, tmp_path, monkeypatch):
+    path = make_smx()
+    with PluginCache(str(tmp_path / 'cache.db')) as cache:
+        cache.describe(path)
+
+        monkeypatch.chdir(tmp_path)
+        assert json.loads(cache.lookup('plugin.smx'))['path'] == 'plugin.smx'
+
+
+def test_cache_misses_changed_plugins(make_smx, tmp_path):
+    path = make_smx()
+    with PluginCache(str(tmp_path / 'cache.db')) as cache:
+        cache.describe(path)
+        make_smx(publics=['Changed'])
+        os.utime(path, (0, 0))
+
+        assert cache.lookup(path) is None
+        assert cache.describe(path)['publics'] == ['Changed']
+
+
+def test_cache_skips_failures(make_smx, tmp_path):
+    path = make_smx(contents=b'FFPS\x02')
+    with PluginCache(str(tmp_path / 'cache.db')) as cache:
+        assert 'error' in cache.describe(path)
+        assert cache.lookup(path) is None
+
+        out = io.StringIO()
+        assert scan.scan([path], out, processes=1, cache=cache) == 1
+        assert 'error' in json.loads(out.getvalue())
+        assert cache.lookup(path) is None
+
+
+def test_scan_reports_vanished_plugins(make_smx, tmp_path, monkeypatch):
+    paths = [make_smx('a.smx'), make_smx('b.smx')]
+    monkeypatch.setattr(scan, 'find_plugins',
+                        lambda _: paths + [str(tmp_path / 'gone.smx')])
+
+    out = io.StringIO()
+    with PluginCache(str(tmp_path / 'cache.db')) as cache:
+        assert scan.scan([str(tmp_path)], out, processes=1, cache=cache) == 3
+
+    records = {os.path.basename(record['path']): record
+               for record in map(json.loads, out.getvalue().splitlines())}
+    assert 'No such file' in records['gone.smx']['error']
+    assert records['a.smx']['myinfo'] == MYINFO
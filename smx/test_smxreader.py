@@ -0,0 +1,227 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+from smxbuilder import MYINFO, build_smx
+from smxreader import (
+    SourcePawnPlugin,
+    SourcePawnPluginError,
+    SourcePawnPluginFormatError,
+    StringTable,
+    _Inflater,
+    np,
+)
+
+needs_numpy = pytest.mark.skipif(np is None, reason='NumPy is not installed')
+
+
+def load_buffer(path, lazy=False):
+    with open(path, 'rb') as fp:
+        return SourcePawnPlugin(io.BytesIO(fp.read()), lazy=lazy)
+
+
+def load_file(path, lazy=False):
+    return SourcePawnPlugin.from_file(path, lazy=lazy)
+
+
+@pytest.mark.parametrize('load', [load_file, load_buffer])
+@pytest.mark.parametrize('lazy', [False, True])
+@pytest.mark.parametrize('compress', [False, True])
+def test_load(make_smx, load, lazy, compress):
+    plugin = load(make_smx(compress=compress), lazy=lazy)
+
+    assert plugin.compression == int(compress)
+    assert plugin.myinfo == MYINFO
+    assert str(plugin) == 'Test Plugin by someone'
+    assert [public.name for public in plugin.publics] == [
+        'OnPluginStart', 'OnMapStart', 'OnClientConnected']
+    assert [public.code_offs - plugin.data for public in plugin.publics] == [
+        0, 8, 16]
+    assert [pubvar.name for pubvar in plugin.pubvars] == ['myinfo']
+    assert [native.name for native in plugin.natives] == [
+        'PrintToServer', 'GetClientCount']
+    assert (plugin.pcode.version, plugin.pcode.size) == (10, 24)
+    assert len(plugin.base) == plugin.imagesize
+
+
+def test_eager_load_decodes_everything(make_smx):
+    plugin = load_file(make_smx())
+    for name in SourcePawnPlugin._LAZY_ATTRIBUTES:
+        assert name in plugin.__dict__
+
+
+def test_lazy_load_decodes_on_access(make_smx):
+    plugin = load_file(make_smx(), lazy=True)
+    for name in SourcePawnPlugin._LAZY_ATTRIBUTES:
+        assert name not in plugin.__dict__
+
+    plugin.natives
+    assert 'natives' in plugin.__dict__
+    assert 'publics' not in plugin.__dict__
+
+
+def test_lazy_load_inflates_only_as_far_as_needed(make_smx, monkeypatch):
+    monkeypatch.setattr(_Inflater, 'CHUNK_SIZE', 16)
+    path = make_smx(compress=True, publics=['f%d' % i for i in range(100)])
+    plugin = load_file(path, lazy=True)
+    inflater = plugin._inflater
+
+    # .code comes first, so its header needs only the start of the image
+    assert plugin.pcode.version == 10
+    assert inflater.filled < plugin.imagesize
+
+    assert len(plugin.publics) == 100
+    assert inflater.filled == plugin.imagesize
+
+
+def test_close(make_smx):
+    with load_file(make_smx(), lazy=True) as plugin:
+        mm = plugin._mmap
+        assert plugin.myinfo == MYINFO
+
+    assert mm.closed
+    assert plugin.sections == {}
+    assert plugin.publics is None
+
+
+def test_reload_closes_previous_map(make_smx):
+    plugin = load_file(make_smx('a.smx'))
+    mm = plugin._mmap
+    plugin.extract_from_file(make_smx('b.smx', publics=['OnlyOne']))
+
+    assert mm.closed
+    assert [public.name for public in plugin.publics] == ['OnlyOne']
+    plugin.close()
+
+
+def with_header(contents, **fields):
+    values = dict(zip(
+        ('magic', 'version', 'compression', 'disksize', 'imagesize',
+         'sections', 'stringtab', 'dataoffs'),
+        struct.unpack_from('<IHBIIBII', contents)))
+    values.update(fields)
+    return struct.pack('<IHBIIBII', *values.values()) + contents[24:]
+
+
+@pytest.mark.parametrize('load', [load_file, load_buffer])
+@pytest.mark.parametrize('contents,message', [
+    (b'', 'empty|too short'),
+    (b'FFPS\x02', 'too short'),
+    (b'\0' * 24, 'magic number'),
+    (with_header(b'\0' * 24, magic=0x53504646, compression=9), 'compression'),
+    (with_header(b'\0' * 24, magic=0x53504646, sections=6, dataoffs=142),
+     'truncated'),
+])
+def test_invalid_header(make_smx, load, contents, message):
+    path = make_smx(contents=contents)
+    with pytest.raises(SourcePawnPluginError, match=message):
+        load(path)
+
+
+@pytest.mark.parametrize('load', [load_file, load_buffer])
+def test_truncated_headers(make_smx, load):
+    path = make_smx(truncate=100)
+    with pytest.raises(SourcePawnPluginFormatError, match='truncated'):
+        load(path)
+
+
+@pytest.mark.parametrize('load', [load_file, load_buffer])
+def test_truncated_image(make_smx, load):
+    path = make_smx(truncate=-10)
+    with pytest.raises(SourcePawnPluginFormatError, match='past the end'):
+        load(path, lazy=True)
+
+
+@pytest.mark.parametrize('load', [load_file, load_buffer])
+def test_truncated_compressed_image(make_smx, load):
+    path = make_smx(compress=True, truncate=-10)
+
+    # Nothing is inflated until it's needed...
+    plugin = load(path, lazy=True)
+    with pytest.raises(SourcePawnPluginFormatError, match='smaller'):
+        plugin.natives
+
+    with pytest.raises(SourcePawnPluginFormatError, match='smaller'):
+        load(path)
+
+
+@needs_numpy
+def test_records_view_the_image(make_smx):
+    with load_file(make_smx(), lazy=True) as plugin:
+        mm = plugin._mmap
+        publics = plugin.records('.publics')
+        natives = plugin.records('.natives')
+
+        assert publics.dtype == SourcePawnPlugin.sp_file_publics.dtype()
+        assert publics.dtype.names == ('address', 'name')
+        assert publics['address'].tolist() == [0, 8, 16]
+        assert [plugin.strings[offs] for offs in natives['name'].tolist()] == [
+            'PrintToServer', 'GetClientCount']
+
+    # The views keep the map open until they go
+    assert not mm.closed
+    assert publics['address'].tolist() == [0, 8, 16]
+    del publics, natives
+
+
+def test_inflater_fills_incrementally():
+    head = b'H' * 8
+    image = bytes(range(256)) * 4
+    inflater = _Inflater(head, memoryview(zlib.compress(image)), len(head),
+                         len(head) + len(image))
+    inflater.CHUNK_SIZE = 8
+
+    inflater.ensure(20)
+    assert 20 <= inflater.filled < len(inflater.image)
+    inflater.ensure(len(inflater.image))
+    assert bytes(inflater.image) == head + image
+
+
+@pytest.mark.parametrize('imagesize,message', [
+    (100, 'larger'),
+    (2000, 'smaller'),
+])
+def test_inflater_checks_image_size(imagesize, message):
+    inflater = _Inflater(b'', zlib.compress(b'x' * 1000), 0, imagesize)
+    with pytest.raises(SourcePawnPluginFormatError, match=message):
+        inflater.ensure(imagesize)
+
+
+@pytest.mark.parametrize('compressed,message', [
+    (zlib.compress(b'x' * 1000), 'larger'),
+    (zlib.compress(b'x' * 100) + b'junk', 'trailing'),
+])
+def test_inflater_checks_past_a_full_image(compressed, message):
+    inflater = _Inflater(b'', compressed, 0, 100)
+    inflater.CHUNK_SIZE = 1
+    with pytest.raises(SourcePawnPluginFormatError, match=message):
+        inflater.ensure(100)
+
+
+@pytest.mark.parametrize('load', [load_file, load_buffer])
+def test_trailing_compressed_data(make_smx, load):
+    contents = build_smx(compress=True) + b'junk'
+    disksize, = struct.unpack_from('<I', contents, 7)
+    path = make_smx(contents=with_header(contents, disksize=disksize + 4))
+    with pytest.raises(SourcePawnPluginFormatError, match='trailing'):
+        load(path)
+
+
+def test_string_table():
+    base = bytearray(b'XXfoo\0bar\0baz')
+    table = StringTable(base, 2, len(base))
+
+    assert table[0] == 'foo'
+    assert table[4] == 'bar'
+    assert table.lookup_many([4, 0, 4]) == ['bar', 'foo', 'bar']
+
+    # Lookups are memoized
+    base[2:5] = b'FOO'
+    assert table[0] == 'foo'
+
+    with pytest.raises(SourcePawnPluginFormatError):
+        table[8]
+    with pytest.raises(SourcePawnPluginFormatError):
+        table.lookup_many([4, 8])